@@ -0,0 +1,359 @@
+"""Offline benchmark for the ingest and query hot paths.
+
+    python benchmark.py --images 200 --output bench.json
+    python benchmark.py --images 200 --compare bench.json
+
+Generates a synthetic corpus of JPEGs with EXIF and GPS in a scratch
+directory, then times image loading, EXIF parsing, embedding, index writes,
+end-to-end `vectorize_directory`, and query/`rag.search` latency. The
+embedding model and Gemini are replaced by deterministic stubs by default, so
+no network, API key or model weights are needed and numbers are comparable
+between runs. Results are written as JSON; `--compare` diffs them against an
+earlier run and exits non-zero when a metric regressed beyond `--tolerance`.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import numpy as np
+from PIL import Image, ExifTags
+import metrics as stage_metrics
+import vector_db
+from library import Library, Metadata
+from vector_db import BATCH_SIZE, EMBED_SIZE, embed_images, fetch_batches, get_collection, vectorize_directory
+
+# (lat, lon) centres the synthetic photos are scattered around
+CITIES = [
+    (35.6895, 139.6917),
+    (48.8566, 2.3522),
+    (40.7128, -74.0060),
+    (-33.8688, 151.2093),
+    (37.7749, -122.4194),
+    (51.5074, -0.1278),
+]
+CAMERAS = [("Apple", "iPhone 15 Pro"), ("Canon", "EOS R6"), ("SONY", "ILCE-7M4"), ("FUJIFILM", "X-T5")]
+QUESTIONS = [
+    "Which pictures were taken in {city}?",
+    "Show me photos of the beach near {city}",
+    "Photos from a night out in {city}",
+    "What did I eat in {city}?",
+]
+CITY_NAMES = ["Tokyo", "Paris", "New York", "Sydney", "San Francisco", "London"]
+
+
+class StubEmbeddingFunction:
+    """Deterministic stand-in for OpenCLIP with the same call shape.
+
+    Images are embedded by projecting an 8x8 thumbnail onto fixed random
+    axes and text by seeding a vector from its hash, so results are stable
+    across runs and cost almost nothing next to decoding.
+    """
+    def __init__(self, dim=1024, seed=0):
+        self.dim = dim
+        self.projection = np.random.default_rng(seed).standard_normal((8 * 8 * 3, dim)).astype(np.float32)
+
+    def __call__(self, input):
+        vectors = []
+        for item in input:
+            if isinstance(item, str):
+                seed = int.from_bytes(hashlib.sha1(item.encode("utf-8")).digest()[:8], "big")
+                vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            else:
+                small = Image.fromarray(np.asarray(item)).convert("RGB").resize((8, 8), Image.Resampling.BILINEAR)
+                vector = (np.asarray(small, dtype=np.float32).reshape(-1) / 255.0 - 0.5) @ self.projection
+            vectors.append(vector / (np.linalg.norm(vector) or 1.0))
+        return vectors
+
+
+def stub_llm_client(answer="I don't see that in your photos"):
+    """Object with the `models.generate_content` surface of `google.genai.Client`."""
+    def generate_content(model, contents):
+        return SimpleNamespace(text=answer)
+
+    async def agenerate_content(model, contents):
+        return SimpleNamespace(text=answer)
+
+    return SimpleNamespace(models=SimpleNamespace(generate_content=generate_content),
+                           aio=SimpleNamespace(models=SimpleNamespace(generate_content=agenerate_content)))
+
+
+def _dms(value):
+    value = abs(value)
+    degrees = int(value)
+    minutes = int((value - degrees) * 60)
+    seconds = round((value - degrees - minutes / 60) * 3600, 2)
+    return (float(degrees), float(minutes), seconds)
+
+
+def synthetic_exif(rng, index, gps_fraction=0.8):
+    make, model = CAMERAS[index % len(CAMERAS)]
+    taken = datetime(2020, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=int(rng.integers(0, 5 * 365 * 86400)))
+    exif = Image.Exif()
+    exif[ExifTags.Base.Make] = make
+    exif[ExifTags.Base.Model] = model
+    exif[ExifTags.Base.Software] = "photo_search benchmark"
+    exif[ExifTags.Base.DateTime] = taken.strftime("%Y:%m:%d %H:%M:%S")
+    exif[ExifTags.Base.XResolution] = 72.0
+    exif[ExifTags.Base.YResolution] = 72.0
+    details = exif.get_ifd(ExifTags.IFD.Exif)
+    details[ExifTags.Base.Flash] = int(rng.choice([0, 16, 24]))
+    details[ExifTags.Base.FocalLength] = float(rng.choice([4.2, 24.0, 35.0, 50.0]))
+    details[ExifTags.Base.LensMake] = make
+    details[ExifTags.Base.LensModel] = f"{model} lens"
+    if rng.random() < gps_fraction:
+        lat, lon = CITIES[int(rng.integers(len(CITIES)))]
+        lat += float(rng.normal(0, 0.05))
+        lon += float(rng.normal(0, 0.05))
+        gps = exif.get_ifd(ExifTags.IFD.GPSInfo)
+        gps.update({
+            ExifTags.GPS.GPSLatitudeRef: "N" if lat >= 0 else "S",
+            ExifTags.GPS.GPSLatitude: _dms(lat),
+            ExifTags.GPS.GPSLongitudeRef: "E" if lon >= 0 else "W",
+            ExifTags.GPS.GPSLongitude: _dms(lon),
+            ExifTags.GPS.GPSAltitudeRef: b"\x00",
+            ExifTags.GPS.GPSAltitude: float(round(rng.uniform(0, 500), 1)),
+            ExifTags.GPS.GPSImgDirection: float(round(rng.uniform(0, 360), 1)),
+        })
+    return exif
+
+
+def generate_corpus(directory, count, size=(1024, 768), seed=0, quality=90):
+    """Write `count` JPEGs with EXIF (and mostly GPS) into `directory`.
+
+    Pixels are upscaled low-frequency noise plus grain, which compresses
+    and decodes like a photo rather than a flat test card.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    width, height = size
+    for i in range(count):
+        coarse = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+        base = np.asarray(Image.fromarray(coarse).resize((width, height), Image.Resampling.BICUBIC), dtype=np.int16)
+        grain = rng.integers(-12, 13, (height, width, 3), dtype=np.int16)
+        pixels = np.clip(base + grain, 0, 255).astype(np.uint8)
+        Image.fromarray(pixels).save(os.path.join(directory, f"IMG_{i:05d}.jpg"), quality=quality,
+                                     exif=synthetic_exif(rng, i))
+    return directory
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _percentiles(samples, prefix):
+    samples_ms = np.asarray(samples) * 1000
+    return {f"{prefix}_p50_ms": float(np.percentile(samples_ms, 50)),
+            f"{prefix}_p95_ms": float(np.percentile(samples_ms, 95))}
+
+
+def bench_load(directory, workers):
+    metrics = {}
+    start = time.perf_counter()
+    count = sum(1 for _ in Library(directory, workers=workers, load_pixels=False).data)
+    metrics["load_metadata_images_per_sec"] = count / (time.perf_counter() - start)
+    start = time.perf_counter()
+    count = 0
+    for data in Library(directory, workers=workers, target_size=EMBED_SIZE).data:
+        data["image_np"]
+        count += 1
+    metrics["load_images_per_sec"] = count / (time.perf_counter() - start)
+
+    parse = 0.0
+    paths = list(Library(directory, load_pixels=False).list_images())
+    for path in paths:
+        with Image.open(path) as img:
+            start = time.perf_counter()
+            Metadata.from_image(path, img)
+            parse += time.perf_counter() - start
+    metrics["metadata_parse_us"] = parse / len(paths) * 1e6
+    return metrics
+
+
+def bench_index(directory, workers, backend, batch_size):
+    """Embedding throughput and raw index write time, outside `vectorize_directory`."""
+    collection = get_collection("bench-index", backend)
+    embed_seconds = add_seconds = 0.0
+    count = 0
+    for ids, metadatas, images in fetch_batches(directory, batch_size=batch_size, workers=workers):
+        start = time.perf_counter()
+        embeddings = embed_images(images)
+        embed_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        collection.add(ids=ids, embeddings=embeddings, metadatas=metadatas)
+        add_seconds += time.perf_counter() - start
+        count += len(ids)
+    if backend != "chroma":
+        start = time.perf_counter()
+        collection.persist()
+        add_seconds += time.perf_counter() - start
+    return {
+        "embed_images_per_sec": count / embed_seconds if embed_seconds else 0.0,
+        "collection_add_ms_per_image": add_seconds / count * 1000 if count else 0.0,
+    }
+
+
+def bench_ingest(directory, workers, backend, batch_size):
+    """End-to-end `vectorize_directory`, then a no-op incremental rerun."""
+    count = sum(1 for _ in Library(directory, load_pixels=False).list_images())
+    start = time.perf_counter()
+    vectorize_directory(directory, backend=backend, batch_size=batch_size, workers=workers)
+    ingest_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    vectorize_directory(directory, backend=backend, batch_size=batch_size, workers=workers)
+    return {
+        "ingest_images_per_sec": count / ingest_seconds,
+        "ingest_noop_rerun_s": time.perf_counter() - start,
+    }
+
+
+def bench_query(backend, n_queries):
+    questions = [QUESTIONS[i % len(QUESTIONS)].format(city=CITY_NAMES[(i // len(QUESTIONS)) % len(CITY_NAMES)])
+                 + ("" if i < len(QUESTIONS) * len(CITY_NAMES) else f" #{i}")
+                 for i in range(n_queries)]
+    collection = get_collection(backend=backend)
+    embed = vector_db.get_embedding_function()
+    samples = []
+    for question in questions:
+        start = time.perf_counter()
+        collection.query(query_embeddings=embed([question]), n_results=3, include=["metadatas"])
+        samples.append(time.perf_counter() - start)
+    metrics = _percentiles(samples, "vector_query")
+
+    try:
+        import rag
+    except ImportError as e:
+        print(f"Skipping rag.search timings: {e}")
+        return metrics
+    # Swap in the stub LLM, and point rag (which queries the default backend) at the benchmarked one
+    rag.get_client = stub_llm_client
+    rag.get_collection = lambda: get_collection(backend=backend)
+    rag.text_embedding_cache.clear()
+    search_samples, cached_samples, explain_samples = [], [], []
+    for question in questions:
+        rag.result_cache.clear()
+        start = time.perf_counter()
+        context = rag.search(question)
+        search_samples.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        rag.search(question)
+        cached_samples.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        rag.explain(context, question)
+        explain_samples.append(time.perf_counter() - start)
+    metrics.update(_percentiles(search_samples, "search"))
+    metrics.update(_percentiles(cached_samples, "search_cached"))
+    metrics.update(_percentiles(explain_samples, "explain_stub_llm"))
+    return metrics
+
+
+def compare(results, baseline, tolerance):
+    """Print per-metric changes against `baseline`; return the names that regressed."""
+    regressions = []
+    for name, value in results["metrics"].items():
+        previous = baseline.get("metrics", {}).get(name)
+        if not previous:
+            continue
+        change = (value - previous) / previous
+        # Throughputs should go up; times and memory should go down
+        worse = -change if name.endswith("_per_sec") else change
+        flag = ""
+        if worse > tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:36s} {previous:12.3f} -> {value:12.3f} ({change:+.1%}){flag}")
+    return regressions
+
+
+def run(args):
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="photo_search_bench_"))
+    corpus = os.path.abspath(args.corpus or os.path.join(workdir, "photos"))
+    if not args.corpus or not os.path.exists(corpus):
+        width, height = (int(v) for v in args.size.lower().split("x"))
+        start = time.perf_counter()
+        generate_corpus(corpus, args.images, (width, height), seed=args.seed)
+        print(f"Generated {args.images} photos in {time.perf_counter() - start:.1f}s")
+    state = os.path.join(workdir, "state")
+    os.makedirs(state, exist_ok=True)
+    # Collections, manifests, thumbnails and embedding caches all live under relative paths
+    cwd = os.getcwd()
+    os.chdir(state)
+    if args.embedder == "stub":
+        vector_db.set_embedding_function(StubEmbeddingFunction())
+    count = sum(1 for _ in Library(corpus, load_pixels=False).list_images())
+    try:
+        metrics = {}
+        metrics.update(bench_load(corpus, args.workers))
+        metrics.update(bench_index(corpus, args.workers, args.backend, args.batch_size))
+        metrics.update(bench_ingest(corpus, args.workers, args.backend, args.batch_size))
+        metrics.update(bench_query(args.backend, args.queries))
+        metrics["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        os.chdir(cwd)
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "images": count,
+            "size": args.size,
+            "backend": args.backend,
+            "embedder": args.embedder,
+            "workers": args.workers,
+            "batch_size": args.batch_size,
+            "queries": args.queries,
+            "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "metrics": metrics,
+        # Per-stage timers recorded by the pipeline itself (see metrics.py)
+        "stages": stage_metrics.registry.snapshot(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark photo_search ingestion and query paths offline.")
+    parser.add_argument("--images", type=int, default=200, help="Synthetic photos to generate")
+    parser.add_argument("--size", default="1024x768", help="Synthetic photo size, WIDTHxHEIGHT")
+    parser.add_argument("--corpus", help="Reuse (or create) the corpus in this directory")
+    parser.add_argument("--workdir", help="Keep index state here instead of a temporary directory")
+    parser.add_argument("--keep", action="store_true", help="Don't delete the temporary directory")
+    parser.add_argument("--backend", default="numpy", choices=["chroma", "numpy", "hnsw"])
+    parser.add_argument("--embedder", default="stub", choices=["stub", "openclip"])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Relative slowdown tolerated before --compare reports a regression")
+    args = parser.parse_args()
+
+    results = run(args)
+    print(json.dumps(results["metrics"], indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
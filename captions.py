@@ -0,0 +1,38 @@
+from functools import lru_cache
+from PIL import Image
+from text_index import tokenize
+
+# Small enough to run on CPU during ingest; any transformers image-to-text model works
+CAPTION_MODEL = "Salesforce/blip-image-captioning-base"
+CAPTION_BATCH_SIZE = 8
+CAPTION_MAX_TOKENS = 30
+MAX_TAGS = 12
+
+
+@lru_cache(maxsize=None)
+def get_captioner(model_name=CAPTION_MODEL, max_new_tokens=CAPTION_MAX_TOKENS):
+    """Load the local image-to-text pipeline on first use; transformers is only imported here."""
+    from transformers import pipeline
+    return pipeline("image-to-text", model=model_name, max_new_tokens=max_new_tokens)
+
+
+def caption_tags(caption, max_tags=MAX_TAGS):
+    """Distinct content words of a caption, in order, as a comma-separated string."""
+    tags = list(dict.fromkeys(tokenize(caption)))[:max_tags]
+    return ", ".join(tags)
+
+
+def caption_images(images, batch_size=CAPTION_BATCH_SIZE, model_name=CAPTION_MODEL):
+    """Caption decoded images (numpy arrays or PIL images); returns [(caption, tags)]."""
+    if not len(images):
+        return []
+    pil_images = [image if isinstance(image, Image.Image) else Image.fromarray(image) for image in images]
+    outputs = get_captioner(model_name)(pil_images, batch_size=batch_size)
+    results = []
+    for output in outputs:
+        # Pipelines return one list of candidates per input image
+        if isinstance(output, list):
+            output = output[0]
+        caption = output.get("generated_text", "").strip()
+        results.append((caption, caption_tags(caption)))
+    return results
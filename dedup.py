@@ -0,0 +1,153 @@
+import bisect
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+# Max Hamming distance (of 64 bits) for two dHashes to count as the same shot.
+# Measured on test_photos: the closest real near-duplicate pair (IMG_4577/4578)
+# is at 12, while the closest unrelated pair is at 19.
+DUPLICATE_DISTANCE = 12
+# Shots from the same camera this close in time are a burst. Burst frames move
+# more than the hash tolerates (IMG_5262-5264, 1s apart, are 15-21 apart), so
+# they get a looser distance that still rejects an unrelated scene.
+BURST_SECONDS = 5
+BURST_DISTANCE = 24
+
+
+def dhash(image, hash_size=HASH_SIZE):
+    """Difference hash of a PIL image as a `hash_size**2`-bit int.
+
+    JPEGs that haven't been decoded yet are drafted down first, so hashing
+    costs a fraction of a full decode.
+    """
+    image.draft("L", (hash_size * 4, hash_size * 4))
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """Burkhard-Keller tree over hashes for Hamming-radius lookups.
+
+    Each child edge is labelled with its distance to the parent, so by the
+    triangle inequality a search only descends into edges within
+    `max_distance` of the query's distance to the node.
+    """
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, hash_value, item):
+        node = [hash_value, item, {}]
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            dist = hamming_distance(hash_value, current[0])
+            child = current[2].get(dist)
+            if child is None:
+                current[2][dist] = node
+                return
+            current = child
+
+    def search(self, hash_value, max_distance):
+        """Return [(distance, hash, item)] within `max_distance`, closest first."""
+        if self.root is None:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            node_hash, item, children = stack.pop()
+            dist = hamming_distance(hash_value, node_hash)
+            if dist <= max_distance:
+                found.append((dist, node_hash, item))
+            for edge, child in children.items():
+                if dist - max_distance <= edge <= dist + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda match: match[0])
+        return found
+
+    def __len__(self):
+        return self.size
+
+
+def camera_key(metadata):
+    """"Make Model" of the camera that took a photo, or None when EXIF doesn't say."""
+    camera = " ".join(str(metadata[field]).strip() for field in ("Make", "Model") if metadata.get(field))
+    return camera or None
+
+
+class DuplicateGrouper:
+    """Assigns each photo to a near-duplicate group.
+
+    A photo joins a group when its hash is within `max_distance` of the
+    group's representative, or when it is part of a burst: taken by the
+    same camera (see `camera_key`) within `burst_seconds` of a group member
+    and within `burst_distance` of that group's representative. Only
+    representatives are stored in the tree, so groups can't chain through a
+    run of slowly drifting frames by hash alone. A photo that matches nothing starts a
+    new group and becomes its representative; the group id is the
+    representative's photo id.
+    """
+    def __init__(self, max_distance=DUPLICATE_DISTANCE, burst_seconds=BURST_SECONDS,
+                 burst_distance=BURST_DISTANCE):
+        self.max_distance = max_distance
+        self.burst_seconds = burst_seconds
+        self.burst_distance = burst_distance
+        self.tree = BKTree()
+        self.representatives = {}
+        # camera -> sorted [(timestamp, group_id)] of every member, for burst lookups
+        self.timelines = {}
+
+    def add_representative(self, item_id, hash_value, timestamp=None, camera=None):
+        self.tree.add(hash_value, item_id)
+        self.representatives[item_id] = hash_value
+        self.add_member(item_id, item_id, timestamp, camera)
+
+    def add_member(self, item_id, group_id, timestamp=None, camera=None):
+        if timestamp is None or not camera or group_id not in self.representatives:
+            return
+        bisect.insort(self.timelines.setdefault(camera, []), (timestamp, group_id))
+
+    def _burst_group(self, hash_value, timestamp, camera):
+        if timestamp is None or not camera or camera not in self.timelines:
+            return None
+        timeline = self.timelines[camera]
+        lo = bisect.bisect_left(timeline, (timestamp - self.burst_seconds,))
+        hi = bisect.bisect_right(timeline, (timestamp + self.burst_seconds, chr(0x10FFFF)))
+        best = None
+        for shot_time, group_id in timeline[lo:hi]:
+            dist = hamming_distance(hash_value, self.representatives[group_id])
+            if dist <= self.burst_distance and (best is None or dist < best[0]):
+                best = (dist, group_id)
+        return best[1] if best is not None else None
+
+    def assign(self, item_id, hash_value, timestamp=None, camera=None):
+        matches = self.tree.search(hash_value, self.max_distance)
+        group_id = matches[0][2] if matches else self._burst_group(hash_value, timestamp, camera)
+        if group_id is None:
+            self.add_representative(item_id, hash_value, timestamp, camera)
+            return item_id
+        self.add_member(item_id, group_id, timestamp, camera)
+        return group_id
+
+
+def collapse_duplicates(metadatas):
+    """Keep the best-ranked result of each near-duplicate group."""
+    seen = set()
+    collapsed = []
+    for md in metadatas:
+        group_id = md.get("GroupId")
+        if group_id is not None:
+            if group_id in seen:
+                continue
+            seen.add(group_id)
+        collapsed.append(md)
+    return collapsed
@@ -1,6 +1,9 @@
 import argparse
+import json
 import os
 import sys
+import numpy as np
+from vector_index import PAGE_SIZE, iter_pages
 
 
 def connect_client(persist_path):
@@ -16,49 +19,210 @@ def connect_client(persist_path):
         sys.exit(1)
 
 
-def list_and_display(client, collection_name=None, limit=10):
-    def _print_collection(col):
+def _rows(page):
+    ids = page.get("ids", []) or []
+    uris = page.get("uris") or []
+    metadatas = page.get("metadatas") or []
+    for idx, item_id in enumerate(ids):
+        row = {"id": item_id}
+        if idx < len(uris) and uris[idx]:
+            row["uri"] = uris[idx]
+        row.update((metadatas[idx] if idx < len(metadatas) else None) or {})
+        yield row
+
+
+class CollectionStats:
+    """Streaming summary of a collection: count, null rate per field and GPS coverage."""
+    def __init__(self):
+        self.count = 0
+        self.present = {}
+        self.types = {}
+        self.with_gps = 0
+
+    def add(self, row):
+        self.count += 1
+        for key, value in row.items():
+            if value is None or value == "":
+                continue
+            self.present[key] = self.present.get(key, 0) + 1
+            self.types.setdefault(key, set()).add(type(value).__name__)
+        if row.get("GPSLatitude") is not None and row.get("GPSLongitude") is not None:
+            self.with_gps += 1
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "gps_coverage": self.with_gps / self.count if self.count else 0.0,
+            "null_rates": {key: 1 - present / self.count for key, present in sorted(self.present.items())},
+        }
+
+    def print(self):
+        summary = self.as_dict()
+        print(f"  items: {summary['count']}")
+        print(f"  GPS coverage: {summary['gps_coverage']:.1%}")
+        for key, rate in summary["null_rates"].items():
+            print(f"    {key}: {rate:.1%} null")
+
+
+def collection_stats(col, page_size=PAGE_SIZE, offset=0, limit=None):
+    stats = CollectionStats()
+    for _, page in iter_pages(col, ("metadatas",), page_size, offset, limit):
+        for row in _rows(page):
+            stats.add(row)
+    return stats
+
+
+def _arrow_type(pa, type_names):
+    if type_names == {"bool"}:
+        return pa.bool_()
+    if type_names == {"int"}:
+        return pa.int64()
+    if type_names <= {"int", "float"}:
+        return pa.float64()
+    return pa.string()
+
+
+def export_collection(col, output, fmt=None, page_size=PAGE_SIZE, offset=0, limit=None,
+                      embeddings_path=None):
+    """Stream a collection to JSONL or Parquet (plus optional embeddings .npy) page by page.
+
+    Memory stays bounded by `page_size` regardless of collection size.
+    Parquet needs a fixed schema, so it first makes a stats-only pass over
+    the metadata to collect every field and its type. Embeddings are
+    written into a memory-mapped .npy whose row i matches output row i.
+    Returns the summary `CollectionStats` and the offset to resume from.
+    """
+    fmt = fmt or ("parquet" if output.endswith(".parquet") else "jsonl")
+    if fmt not in ("jsonl", "parquet"):
+        raise ValueError(f"Unknown export format {fmt!r}; expected 'jsonl' or 'parquet'")
+    include = ["metadatas", "uris"]
+    writer = schema = pa = None
+    if fmt == "parquet":
         try:
-            name = getattr(col, "name", "<unknown>")
-            count = col.count()
-            print(f"\nCollection: {name} (count={count})")
-            if count == 0:
-                return
-            result = col.get(include=["metadatas", "uris"], limit=limit)
-            ids = result.get("ids", []) or []
-            uris = result.get("uris", []) or []
-            metadatas = result.get("metadatas", []) or []
-            for idx, item_id in enumerate(ids):
-                print(f"  - id: {item_id}")
-                uri = uris[idx] if idx < len(uris) else None
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("Parquet export needs pyarrow: pip install pyarrow")
+            sys.exit(1)
+        scan = collection_stats(col, page_size, offset, limit)
+        fields = [pa.field("id", pa.string()), pa.field("uri", pa.string())]
+        fields += [pa.field(key, _arrow_type(pa, scan.types[key])) for key in sorted(scan.types)
+                   if key not in ("id", "uri")]
+        schema = pa.schema(fields)
+        writer = pq.ParquetWriter(output, schema)
+    if embeddings_path:
+        include.append("embeddings")
+    total = max(0, col.count() - offset)
+    if limit is not None:
+        total = min(total, limit)
+    stats = CollectionStats()
+    vectors = None
+    row = 0
+    next_offset = offset
+    f = open(output, "w", encoding="utf-8") if writer is None else None
+    try:
+        for page_offset, page in iter_pages(col, include, page_size, offset, limit):
+            rows = list(_rows(page))
+            for record in rows:
+                stats.add(record)
+            if writer is not None:
+                columns = {field.name: [record.get(field.name) for record in rows] for field in schema}
+                for field in schema:
+                    if pa.types.is_string(field.type):
+                        columns[field.name] = [None if v is None else str(v) for v in columns[field.name]]
+                writer.write_table(pa.table(columns, schema=schema))
+            else:
+                f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in rows)
+            if embeddings_path:
+                embeddings = page.get("embeddings")
+                if embeddings is not None and len(embeddings):
+                    embeddings = np.asarray(embeddings, dtype=np.float32)
+                    if vectors is None:
+                        vectors = np.lib.format.open_memmap(embeddings_path, mode="w+", dtype=np.float32,
+                                                            shape=(total, embeddings.shape[1]))
+                    # Items added since the count was taken don't fit; stop at the preallocated size
+                    n = max(0, min(len(embeddings), total - row))
+                    vectors[row:row + n] = embeddings[:n]
+            row += len(rows)
+            next_offset = page_offset + len(rows)
+            print(f"  exported {row} items (next offset {next_offset})", file=sys.stderr)
+    finally:
+        if writer is not None:
+            writer.close()
+        if f is not None:
+            f.close()
+        if vectors is not None:
+            vectors.flush()
+            del vectors
+    if embeddings_path and row < total:
+        print(f"Warning: collection shrank during export; rows {row}..{total - 1} of {embeddings_path} are zero")
+    return stats, next_offset
+
+
+def display_collection(col, limit=10, page_size=PAGE_SIZE, offset=0):
+    try:
+        name = getattr(col, "name", "<unknown>")
+        count = col.count()
+        print(f"\nCollection: {name} (count={count})")
+        if count == 0:
+            return
+        for _, page in iter_pages(col, ["metadatas", "uris"], page_size, offset, limit):
+            for row in _rows(page):
+                print(f"  - id: {row.pop('id')}")
+                uri = row.pop("uri", None)
                 if uri:
                     print(f"    uri: {uri}")
-                md = metadatas[idx] if idx < len(metadatas) else {}
-                if not md:
+                if not row:
                     print("    metadata: {}")
                 else:
-                    for k, v in md.items():
+                    for k, v in row.items():
                         print(f"    {k}: {v}")
-        except Exception as exc:
-            print(f"Error reading collection '{getattr(col, 'name', '<unknown>')}': {exc}")
+    except Exception as exc:
+        print(f"Error reading collection '{getattr(col, 'name', '<unknown>')}': {exc}")
 
+
+def list_and_display(client, collection_name=None, limit=10, page_size=PAGE_SIZE, offset=0):
     if collection_name:
         col = client.get_collection(collection_name)
-        _print_collection(col)
+        display_collection(col, limit, page_size, offset)
     else:
         cols = client.list_collections()
         if not cols:
             print("No collections found.")
             return
         for col in cols:
-            _print_collection(col)
+            display_collection(col, limit, page_size, offset)
+
+
+def open_local_collections(persist_path, backend, collection_name=None):
+    """The `vector_index` backend's collections stored under `persist_path`, or just `collection_name`."""
+    from vector_index import create_index
+    suffix = f".{backend}"
+    names = [collection_name] if collection_name else sorted(
+        entry.name[:-len(suffix)] for entry in os.scandir(persist_path)
+        if entry.is_dir() and entry.name.endswith(suffix)
+    )
+    missing = [name for name in names if not os.path.isdir(os.path.join(persist_path, name + suffix))]
+    if missing:
+        print(f"No {backend} collection named {missing[0]!r} in {persist_path}")
+        sys.exit(1)
+    return [create_index(backend, name, persist_path) for name in names]
 
 
 def main():
     parser = argparse.ArgumentParser(description="Display contents of a persisted ChromaDB directory.")
     parser.add_argument("--path", default="./chroma_langchain_db", help="Persist directory path (default: ./chroma_langchain_db)")
     parser.add_argument("--collection", default=None, help="Specific collection name to show (default: all)")
-    parser.add_argument("--limit", type=int, default=10, help="Max items to display per collection (default: 10)")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="Max items per collection (default: 10 when listing, all for --export/--stats)")
+    parser.add_argument("--offset", type=int, default=0, help="Start at this item; use the printed next offset to resume")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="Items fetched per request")
+    parser.add_argument("--backend", default="chroma", choices=["chroma", "numpy", "hnsw"],
+                        help="Read a local vector_index backend instead of Chroma")
+    parser.add_argument("--export", default=None, help="Stream the collection to a .jsonl or .parquet file")
+    parser.add_argument("--format", default=None, choices=["jsonl", "parquet"], help="Export format (default: from extension)")
+    parser.add_argument("--embeddings", default=None, help="Also export embeddings to this .npy file")
+    parser.add_argument("--stats", action="store_true", help="Print count, null rates per field and GPS coverage")
     args = parser.parse_args()
 
     persist_path = args.path
@@ -66,11 +230,40 @@ def main():
         print(f"Persist directory not found: {persist_path}")
         sys.exit(1)
 
-    client = connect_client(persist_path)
-    list_and_display(client, collection_name=args.collection, limit=args.limit)
+    if args.backend == "chroma":
+        client = connect_client(persist_path)
+        if args.export or args.stats:
+            if not args.collection:
+                print("--export and --stats need --collection")
+                sys.exit(1)
+            cols = [client.get_collection(args.collection)]
+    else:
+        cols = open_local_collections(persist_path, args.backend, args.collection)
 
+    if args.export or args.stats:
+        if len(cols) != 1:
+            print("--export and --stats need --collection")
+            sys.exit(1)
+        col = cols[0]
+        if args.export:
+            stats, next_offset = export_collection(col, args.export, args.format, args.page_size, args.offset,
+                                                   args.limit, args.embeddings)
+            print(f"Exported {stats.count} items to {args.export}; next offset {next_offset}")
+        else:
+            stats = collection_stats(col, args.page_size, args.offset, args.limit)
+        if args.stats:
+            stats.print()
+        return
+
+    limit = 10 if args.limit is None else args.limit
+    if args.backend == "chroma":
+        list_and_display(client, collection_name=args.collection, limit=limit, page_size=args.page_size,
+                         offset=args.offset)
+    elif not cols:
+        print("No collections found.")
+    else:
+        for col in cols:
+            display_collection(col, limit, args.page_size, args.offset)
 
 if __name__ == "__main__":
     main()
-
-
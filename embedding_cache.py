@@ -0,0 +1,143 @@
+import fcntl
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+import numpy as np
+
+EMBEDDING_CACHE_DIRECTORY = "./embedding_cache"
+
+
+class EmbeddingCache:
+    """Append-only embedding store keyed by image content hash, per model.
+
+    Vectors live in a raw `<model>.<dtype>.bin` matrix that is read through a
+    memory map, with a `<model>.keys` sidecar listing one content hash per
+    row. Rows are written before their keys, so after a crash any rows
+    without a key are truncated on load and every listed key is complete.
+    Nothing here depends on Chroma, so collections can be rebuilt, renamed
+    or migrated without re-running the embedding model. Several processes
+    (e.g. a batch ingest and `sync.py`) can share a cache: writes and crash
+    repair hold an exclusive `flock` on a `<model>.lock` file, rows are
+    numbered from the `.bin` size under that lock, and each process reloads
+    its key index when it sees the `.keys` file has grown.
+    """
+    def __init__(self, model_name, directory=EMBEDDING_CACHE_DIRECTORY, dtype="float16"):
+        os.makedirs(directory, exist_ok=True)
+        stem = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.vectors_path = os.path.join(directory, f"{stem}.{self.dtype.name}.bin")
+        self.keys_path = os.path.join(directory, f"{stem}.keys")
+        self.info_path = os.path.join(directory, f"{stem}.json")
+        self.lock_path = os.path.join(directory, f"{stem}.lock")
+        self.dim = None
+        self.index = {}
+        self._keys_size = 0
+        self._matrix = None
+        self._lock = threading.Lock()
+        with self._file_lock():
+            self._load()
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _stale(self):
+        try:
+            return os.path.getsize(self.keys_path) != self._keys_size
+        except FileNotFoundError:
+            return False
+
+    def _load(self):
+        """(Re)read the key index; callers hold the file lock, so no writer is mid-append."""
+        self._matrix = None
+        if os.path.exists(self.info_path):
+            with open(self.info_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        if self.dim is None or not os.path.exists(self.keys_path):
+            return
+        with open(self.keys_path, "r", encoding="ascii") as f:
+            keys = [line.strip() for line in f if line.strip()]
+        row_bytes = self.dim * self.dtype.itemsize
+        rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        # Drop rows whose key never got written, and keys whose row is incomplete
+        if rows > len(keys):
+            os.truncate(self.vectors_path, len(keys) * row_bytes)
+        elif rows < len(keys):
+            keys = keys[:rows]
+            with open(self.keys_path, "w", encoding="ascii") as f:
+                f.writelines(f"{key}\n" for key in keys)
+        self.index = {key: row for row, key in enumerate(keys)}
+        self._keys_size = os.path.getsize(self.keys_path)
+
+    def _rows(self):
+        if self._matrix is None:
+            self._matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r",
+                                     shape=(len(self.index), self.dim))
+        return self._matrix
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self.index))
+
+    def get_many(self, keys):
+        """Cached float32 vectors for `keys`, with None for misses."""
+        with self._lock:
+            if self._stale() and any(key not in self.index for key in keys):
+                # Another process appended since we loaded; pick up its rows
+                with self._file_lock():
+                    self._load()
+            rows = [self.index.get(key) for key in keys]
+            if not self.index:
+                return [None] * len(keys)
+            matrix = self._rows()
+            return [np.asarray(matrix[row], dtype=np.float32) if row is not None else None for row in rows]
+
+    def put_many(self, keys, vectors):
+        with self._lock, self._file_lock():
+            if self._stale():
+                self._load()
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self.index and key not in new:
+                    new[key] = np.asarray(vector, dtype=np.float32)
+            if not new:
+                return
+            if self.dim is None:
+                self.dim = len(next(iter(new.values())))
+                with open(self.info_path, "w", encoding="utf-8") as f:
+                    json.dump({"model_name": self.model_name, "dim": self.dim}, f)
+            matrix = np.stack(list(new.values())).astype(self.dtype)
+            if matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match cache dimension {self.dim}")
+            with open(self.vectors_path, "ab") as f:
+                # Under the lock the file holds exactly one row per listed key
+                start = os.fstat(f.fileno()).st_size // (self.dim * self.dtype.itemsize)
+                f.write(matrix.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.keys_path, "a", encoding="ascii") as f:
+                f.writelines(f"{key}\n" for key in new)
+            self._keys_size = os.path.getsize(self.keys_path)
+            for offset, key in enumerate(new):
+                self.index[key] = start + offset
+            self._matrix = None
+
+
+@lru_cache(maxsize=None)
+def get_embedding_cache(model_name, directory=EMBEDDING_CACHE_DIRECTORY, dtype="float16"):
+    return EmbeddingCache(model_name, directory, dtype)
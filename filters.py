@@ -0,0 +1,185 @@
+import math
+from datetime import datetime, timezone
+from library import exif_timestamp
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_timestamp(value, end_of_day=False):
+    """Normalize a date bound to the epoch seconds stored in `Timestamp`.
+
+    Accepts epoch numbers, datetime/date objects, ISO strings and EXIF
+    "YYYY:MM:DD HH:MM:SS" strings. Naive values are read as UTC, matching
+    how `exif_timestamp` stores photo times. With `end_of_day`, a bare date
+    (a `date` or a "YYYY-MM-DD" string) means 23:59:59 of that day, so an
+    inclusive upper bound covers the whole day.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    date_only = False
+    if isinstance(value, str):
+        timestamp = exif_timestamp(value)
+        if timestamp is not None:
+            return timestamp
+        date_only = len(value.strip()) == 10
+        value = datetime.fromisoformat(value.strip())
+    if not isinstance(value, datetime):
+        date_only = True
+        value = datetime(value.year, value.month, value.day)
+    if date_only and end_of_day:
+        value = value.replace(hour=23, minute=59, second=59)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def radius_bbox(lat, lon, radius_km):
+    """Smallest (min_lat, min_lon, max_lat, max_lon) box containing the circle."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return (min_lat, -180.0, max_lat, 180.0)
+    dlon = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(lat))))
+    if dlon >= 180.0:
+        return (min_lat, -180.0, max_lat, 180.0)
+    min_lon = (lon - dlon + 540.0) % 360.0 - 180.0
+    max_lon = (lon + dlon + 540.0) % 360.0 - 180.0
+    return (min_lat, min_lon, max_lat, max_lon)
+
+
+_OPERATORS = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def matches_where(metadata, where):
+    """Evaluate a Chroma-style `where` clause against one metadata dict.
+
+    Used by the local vector backends so a `QueryFilter` behaves the same
+    regardless of where the vectors live.
+    """
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key not in metadata:
+            # Like Chroma, a photo without the field never matches a condition on it
+            return False
+        elif isinstance(condition, dict):
+            value = metadata[key]
+            for op, operand in condition.items():
+                try:
+                    if not _OPERATORS[op](value, operand):
+                        return False
+                except TypeError:
+                    return False
+        elif metadata[key] != condition:
+            return False
+    return True
+
+
+def _one_of(field, value):
+    if isinstance(value, (list, tuple, set)):
+        values = list(value)
+        return {field: {"$in": values}} if len(values) > 1 else {field: values[0]}
+    return {field: value}
+
+
+class QueryFilter:
+    """Structured constraints translated into a Chroma `where` clause.
+
+    `bbox` is (min_lat, min_lon, max_lat, max_lon); a min_lon greater than
+    max_lon wraps across the antimeridian. `near` is a (lat, lon) pair used
+    with `radius_km`: Chroma only filters on the enclosing box, and `matches`
+    applies the exact great-circle distance to the returned candidates.
+    `country`/`region`/`city` match the place names attached at ingest by
+    `geocode.ReverseGeocoder`.
+    """
+    def __init__(self, date_from=None, date_to=None, bbox=None, near=None, radius_km=None,
+                 make=None, model=None, country=None, region=None, city=None):
+        if (near is None) != (radius_km is None):
+            raise ValueError("near and radius_km must be given together")
+        self.date_from = to_timestamp(date_from)
+        self.date_to = to_timestamp(date_to, end_of_day=True)
+        self.bbox = bbox
+        self.near = near
+        self.radius_km = radius_km
+        self.make = make
+        self.model = model
+        self.country = country
+        self.region = region
+        self.city = city
+
+    def where(self):
+        clauses = []
+        if self.date_from is not None:
+            clauses.append({"Timestamp": {"$gte": self.date_from}})
+        if self.date_to is not None:
+            clauses.append({"Timestamp": {"$lte": self.date_to}})
+        for bbox in (self.bbox, radius_bbox(*self.near, self.radius_km) if self.near else None):
+            if bbox is not None:
+                clauses.extend(self._bbox_clauses(bbox))
+        if self.make is not None:
+            clauses.append(_one_of("Make", self.make))
+        if self.model is not None:
+            clauses.append(_one_of("Model", self.model))
+        for field, value in (("Country", self.country), ("Region", self.region), ("City", self.city)):
+            if value is not None:
+                clauses.append(_one_of(field, value))
+        if not clauses:
+            return None
+        if len(clauses) == 1:
+            return clauses[0]
+        return {"$and": clauses}
+
+    @staticmethod
+    def _bbox_clauses(bbox):
+        min_lat, min_lon, max_lat, max_lon = bbox
+        clauses = [
+            {"GPSLatitude": {"$gte": min_lat}},
+            {"GPSLatitude": {"$lte": max_lat}},
+        ]
+        if min_lon <= max_lon:
+            clauses.append({"GPSLongitude": {"$gte": min_lon}})
+            clauses.append({"GPSLongitude": {"$lte": max_lon}})
+        else:
+            clauses.append({"$or": [
+                {"GPSLongitude": {"$gte": min_lon}},
+                {"GPSLongitude": {"$lte": max_lon}},
+            ]})
+        return clauses
+
+    def matches(self, metadata):
+        """Exact checks Chroma can't express; currently the radius constraint."""
+        if self.near is None:
+            return True
+        lat = metadata.get("GPSLatitude")
+        lon = metadata.get("GPSLongitude")
+        if lat is None or lon is None:
+            return False
+        return haversine_km(self.near[0], self.near[1], lat, lon) <= self.radius_km
+
+    def __repr__(self):
+        fields = ("date_from", "date_to", "bbox", "near", "radius_km", "make", "model", "country", "region", "city")
+        parts = [f"{name}={getattr(self, name)!r}" for name in fields if getattr(self, name) is not None]
+        return f"QueryFilter({', '.join(parts)})"
@@ -0,0 +1,191 @@
+import csv
+import math
+import os
+from collections import defaultdict
+from functools import lru_cache
+from filters import EARTH_RADIUS_KM, QueryFilter, haversine_km
+
+# GeoNames dumps (https://download.geonames.org/export/dump/): cities1000.txt or
+# cities15000.txt, plus the optional admin1CodesASCII.txt and countryInfo.txt
+# next to it for region and country names.
+GAZETTEER_PATH = os.getenv("PHOTO_GAZETTEER", "./gazetteer/cities15000.txt")
+MAX_PLACE_DISTANCE_KM = 100.0
+
+
+class SpatialIndex:
+    """Fixed-grid bucket index over (lat, lon) points for nearest/radius lookups.
+
+    Points are hashed into `cell_degrees` cells; queries scan rings of cells
+    outward from the query cell and stop once no unvisited cell can hold a
+    closer point, so lookups touch a handful of buckets regardless of size.
+    """
+    def __init__(self, cell_degrees=1.0):
+        n_lon = 360.0 / cell_degrees if cell_degrees > 0 else 0.0
+        # Longitude wraps by whole cells, so the cells must tile the 360 degrees exactly
+        if n_lon < 1 or not math.isclose(n_lon, round(n_lon)):
+            raise ValueError(f"cell_degrees must divide 360 evenly, got {cell_degrees!r}")
+        self.cell_degrees = cell_degrees
+        self.buckets = defaultdict(list)
+        self.points = []
+        self._n_lon = int(round(n_lon))
+        self._min_lon_cell = int(math.floor(-180.0 / cell_degrees))
+        self._min_lat_cell = int(math.floor(-90.0 / cell_degrees))
+        self._max_lat_cell = int(math.floor(90.0 / cell_degrees))
+        self._max_ring = int(math.ceil(180.0 / cell_degrees)) + 1
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lon / self.cell_degrees))
+
+    def add(self, lat, lon, item):
+        self.buckets[self._cell(lat, lon)].append(len(self.points))
+        self.points.append((lat, lon, item))
+
+    def __len__(self):
+        return len(self.points)
+
+    def _wrap_lon(self, cj):
+        # Longitude cells wrap around the antimeridian
+        return (cj - self._min_lon_cell) % self._n_lon + self._min_lon_cell
+
+    def _ring(self, ci, cj, r):
+        """Cells at Chebyshev distance exactly `r` from (ci, cj)."""
+        if r == 0:
+            return [(ci, cj)]
+        cells = set()
+        for i in (ci - r, ci + r):
+            if self._min_lat_cell <= i <= self._max_lat_cell:
+                for dj in range(-r, r + 1):
+                    cells.add((i, self._wrap_lon(cj + dj)))
+        # Past the antipodal column (2r == n_lon, where both sides land on it) the sides were already visited
+        if 2 * r <= self._n_lon:
+            for i in range(max(ci - r + 1, self._min_lat_cell), min(ci + r - 1, self._max_lat_cell) + 1):
+                cells.add((i, self._wrap_lon(cj - r)))
+                cells.add((i, self._wrap_lon(cj + r)))
+        return cells
+
+    def _unvisited_bound_km(self, lat, r, best_km):
+        """Lower bound on the distance to any point outside rings 0..r."""
+        span = math.radians(r * self.cell_degrees)
+        lat_bound = EARTH_RADIUS_KM * span
+        if (2 * r + 1) * self.cell_degrees >= 360.0:
+            return lat_bound
+        lat_max = min(90.0, abs(lat) + math.degrees(best_km / EARTH_RADIUS_KM))
+        lon_bound = 2 * EARTH_RADIUS_KM * math.asin(
+            min(1.0, math.cos(math.radians(lat_max)) * math.sin(span / 2))
+        )
+        return min(lat_bound, lon_bound)
+
+    def nearest(self, lat, lon, max_km=None):
+        """Return (distance_km, item) for the closest point, or None."""
+        ci, cj = self._cell(lat, lon)
+        best = None
+        for r in range(self._max_ring + 1):
+            for cell in self._ring(ci, cj, r):
+                for idx in self.buckets.get(cell, ()):
+                    p_lat, p_lon, item = self.points[idx]
+                    dist = haversine_km(lat, lon, p_lat, p_lon)
+                    if best is None or dist < best[0]:
+                        best = (dist, item)
+            limit = best[0] if best is not None else max_km
+            if limit is not None and self._unvisited_bound_km(lat, r, limit) >= limit:
+                break
+        if best is None or (max_km is not None and best[0] > max_km):
+            return None
+        return best
+
+    def within(self, lat, lon, radius_km):
+        """Return [(distance_km, item)] for all points within `radius_km`, nearest first."""
+        ci, cj = self._cell(lat, lon)
+        found = []
+        for r in range(self._max_ring + 1):
+            for cell in self._ring(ci, cj, r):
+                for idx in self.buckets.get(cell, ()):
+                    p_lat, p_lon, item = self.points[idx]
+                    dist = haversine_km(lat, lon, p_lat, p_lon)
+                    if dist <= radius_km:
+                        found.append((dist, item))
+            if self._unvisited_bound_km(lat, r, radius_km) > radius_km:
+                break
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+def _read_names(path, key_col, name_col):
+    names = {}
+    if not os.path.exists(path):
+        return names
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            if not row or row[0].startswith("#") or len(row) <= max(key_col, name_col):
+                continue
+            names[row[key_col]] = row[name_col]
+    return names
+
+
+class ReverseGeocoder:
+    """Offline reverse geocoding against a local GeoNames cities file.
+
+    `lookup` maps a coordinate to the nearest populated place's
+    Country/CountryCode/Region/City; `find_place` resolves a place name to
+    coordinates for "photos near X" queries. No network access is needed.
+    """
+    def __init__(self, gazetteer_path=GAZETTEER_PATH, max_distance_km=MAX_PLACE_DISTANCE_KM):
+        if not os.path.exists(gazetteer_path):
+            raise FileNotFoundError(f"The gazetteer file {gazetteer_path} does not exist.")
+        self.max_distance_km = max_distance_km
+        directory = os.path.dirname(gazetteer_path)
+        countries = _read_names(os.path.join(directory, "countryInfo.txt"), 0, 4)
+        regions = _read_names(os.path.join(directory, "admin1CodesASCII.txt"), 0, 1)
+        self.index = SpatialIndex()
+        self.places_by_name = {}
+        with open(gazetteer_path, "r", encoding="utf-8") as f:
+            for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+                if len(row) < 15:
+                    continue
+                try:
+                    lat, lon = float(row[4]), float(row[5])
+                    population = int(row[14] or 0)
+                except ValueError:
+                    continue
+                country_code = row[8]
+                place = {
+                    "City": row[1],
+                    "Region": regions.get(f"{country_code}.{row[10]}", row[10]) or None,
+                    "Country": countries.get(country_code, country_code) or None,
+                    "CountryCode": country_code or None,
+                }
+                self.index.add(lat, lon, place)
+                # Keep the most populous place for each name, e.g. Paris FR over Paris TX
+                for name in {row[1].lower(), row[2].lower()}:
+                    current = self.places_by_name.get(name)
+                    if current is None or population > current[2]:
+                        self.places_by_name[name] = (lat, lon, population)
+
+    def lookup(self, lat, lon):
+        """Place fields for a coordinate, or {} when nothing is within range."""
+        if lat is None or lon is None:
+            return {}
+        nearest = self.index.nearest(lat, lon, max_km=self.max_distance_km)
+        if nearest is None:
+            return {}
+        return {k: v for k, v in nearest[1].items() if v is not None}
+
+    def find_place(self, name):
+        """(lat, lon) of the most populous place called `name`, or None."""
+        match = self.places_by_name.get(name.strip().lower())
+        if match is None:
+            return None
+        return match[0], match[1]
+
+
+def near_place(name, radius_km, geocoder, **filters):
+    """QueryFilter for photos within `radius_km` of a named place."""
+    coords = geocoder.find_place(name)
+    if coords is None:
+        raise ValueError(f"Unknown place {name!r}")
+    return QueryFilter(near=coords, radius_km=radius_km, **filters)
+
+
+@lru_cache(maxsize=None)
+def get_reverse_geocoder(gazetteer_path=GAZETTEER_PATH):
+    return ReverseGeocoder(gazetteer_path)
@@ -1,9 +1,15 @@
-from PIL.ExifTags import TAGS, GPSTAGS
 from PIL import Image, ExifTags
 import PIL.TiffImagePlugin
 import os
+import fnmatch
+import hashlib
 import numpy as np
 import fractions
+from datetime import datetime, timezone
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from dedup import dhash
+from manifest import content_hash
 
 def get_float_from_rational(rational):
     res = rational
@@ -14,17 +20,72 @@ def get_float_from_rational(rational):
         res = float(frac)
     return res
 
+def exif_timestamp(value):
+    """Convert an EXIF "YYYY:MM:DD HH:MM:SS" string to sortable epoch seconds.
+
+    EXIF times carry no zone, so they are read as UTC; the result orders
+    photos correctly and compares against dates converted the same way.
+    """
+    try:
+        parsed = datetime.strptime(str(value).strip().rstrip("\x00"), "%Y:%m:%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return None
+    return int(parsed.replace(tzinfo=timezone.utc).timestamp())
+
+def image_id(file_path):
+    """Stable collection id derived from the absolute file path."""
+    digest = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+    return f"img_{digest[:20]}"
+
+def _to_float(value):
+    value = get_float_from_rational(value)
+    try:
+        return float(value)
+    except Exception:
+        return Metadata._sanitize_value(value)
+
+def _to_int(value):
+    if isinstance(value, bool):
+        return value
+    try:
+        return int(value)
+    except Exception:
+        return Metadata._sanitize_value(value)
+
 class Metadata:
+    """EXIF fields kept for each photo, stored in slots.
+
+    Only the tags listed in `_exif_fields` are read, in a single pass over the
+    EXIF mapping, and each value is converted to a Chroma-safe primitive once;
+    the raw EXIF dict is not retained.
+    """
     class GPS:
+        __slots__ = ("GPSLatitude", "GPSLongitude", "GPSAltitude", "GPSDirection")
+
         def __init__(self, gps_info):
-            self.decoded_gps = {GPSTAGS.get(key): val for key, val in gps_info.items()}
             self.GPSLatitude = None
             self.GPSLongitude = None
             self.GPSAltitude = None
             self.GPSDirection = None
-            self.set_GPSInfo()
+            get = gps_info.get
+            latitude, longitude = get(ExifTags.GPS.GPSLatitude), get(ExifTags.GPS.GPSLongitude)
+            latitude_ref, longitude_ref = get(ExifTags.GPS.GPSLatitudeRef), get(ExifTags.GPS.GPSLongitudeRef)
+            if latitude is not None and latitude_ref is not None:
+                self.GPSLatitude = self.get_decimal_from_dms(latitude, latitude_ref)
+            if longitude is not None and longitude_ref is not None:
+                self.GPSLongitude = self.get_decimal_from_dms(longitude, longitude_ref)
+            altitude, altitude_ref = get(ExifTags.GPS.GPSAltitude), get(ExifTags.GPS.GPSAltitudeRef)
+            if altitude is not None and altitude_ref is not None:
+                self.GPSAltitude = self.get_altitude(altitude, altitude_ref)
+            direction = get(ExifTags.GPS.GPSImgDirection)
+            if direction is not None:
+                try:
+                    self.GPSDirection = float(get_float_from_rational(direction))
+                except Exception:
+                    self.GPSDirection = None
         
-        def get_decimal_from_dms(self, dms, ref):
+        @staticmethod
+        def get_decimal_from_dms(dms, ref):
             """Converts DMS (degrees, minutes, seconds) to decimal degrees."""
             try:
                 degrees = float(get_float_from_rational(dms[0]))
@@ -45,52 +106,28 @@ class Metadata:
                 decimal = -decimal
 
             return float(decimal)
-        
-        def set_GPSInfo(self):
-            self.setLatitude()
-            self.setLongitude()
-            self.setAltitude()
-            self.setDirection()
-        
-        def setLatitude(self):
-            if "GPSLatitudeRef" in self.decoded_gps.keys() and "GPSLatitude" in self.decoded_gps.keys():
-                GPSLatitudeRef = self.decoded_gps['GPSLatitudeRef']
-                self.GPSLatitude = self.get_decimal_from_dms(self.decoded_gps['GPSLatitude'], GPSLatitudeRef)
-        
-        def setLongitude(self):
-            if "GPSLongitudeRef" in self.decoded_gps.keys() and "GPSLongitude" in self.decoded_gps.keys():
-                GPSLongitudeRef = self.decoded_gps['GPSLongitudeRef']
-                self.GPSLongitude = self.get_decimal_from_dms(self.decoded_gps['GPSLongitude'], GPSLongitudeRef)
-        
-        def setAltitude(self):
-            if "GPSAltitudeRef" in self.decoded_gps.keys() and "GPSAltitude" in self.decoded_gps.keys():
-                ref = self.decoded_gps['GPSAltitudeRef']
-                altitude = get_float_from_rational(self.decoded_gps['GPSAltitude'])
-                if altitude is None:
-                    self.GPSAltitude = None
-                    return
-                # Normalize ref to an integer 0/1
+
+        @staticmethod
+        def get_altitude(altitude, ref):
+            altitude = get_float_from_rational(altitude)
+            if altitude is None:
+                return None
+            # Normalize ref to an integer 0/1
+            ref_val = 0
+            try:
+                if isinstance(ref, (int, float)):
+                    ref_val = int(ref)
+                elif isinstance(ref, (bytes, bytearray)):
+                    ref_list = list(ref)
+                    ref_val = ref_list[0] if len(ref_list) > 0 else 0
+                else:
+                    ref_val = int(str(ref))
+            except Exception:
                 ref_val = 0
-                try:
-                    if isinstance(ref, (int, float)):
-                        ref_val = int(ref)
-                    elif isinstance(ref, (bytes, bytearray)):
-                        ref_list = list(ref)
-                        ref_val = ref_list[0] if len(ref_list) > 0 else 0
-                    else:
-                        ref_val = int(str(ref))
-                except Exception:
-                    ref_val = 0
-                self.GPSAltitude = float(altitude) if ref_val == 0 else -1.0 * float(altitude)
-        
-        def setDirection(self):
-            if "GPSImgDirection" in self.decoded_gps.keys():
-                direction = self.decoded_gps['GPSImgDirection']
-                direction = get_float_from_rational(direction)
-                try:
-                    self.GPSDirection = float(direction)
-                except Exception:
-                    self.GPSDirection = None
+            try:
+                return float(altitude) if ref_val == 0 else -1.0 * float(altitude)
+            except Exception:
+                return None
         
         def get_dict(self):
             return {
@@ -116,101 +153,51 @@ class Metadata:
                 f"Direction={self.GPSDirection!r})"
             )
 
+    # Flat fields in the order they appear in get_dict(); GPS comes from GPSInfo
+    fields = (
+        "GPSLatitude", "GPSLongitude", "GPSAltitude", "GPSDirection",
+        "Make", "Model", "Software", "DateTime", "Timestamp",
+        "XResolution", "YResolution", "Flash", "FocalLength", "LensMake", "LensModel"
+    )
+    __slots__ = ("image_path", "GPSInfo", "Make", "Model", "Software", "DateTime", "Timestamp",
+                 "XResolution", "YResolution", "Flash", "FocalLength", "LensMake", "LensModel")
+
     def __init__(self, image_path, exif_data):
-        self.decoded_exif = {TAGS.get(key): val for key, val in (exif_data.items() if exif_data else [])}
         self.image_path = image_path
-        self.exif_data = exif_data
         self.GPSInfo = None
         self.Make = None
         self.Model = None
         self.Software = None
         self.DateTime = None
+        self.Timestamp = None
         self.XResolution = None
         self.YResolution = None
         self.Flash = None
         self.FocalLength = None
         self.LensMake = None
         self.LensModel = None
-        self.set_metadata()
-    
-    def set_metadata(self):
-        self.set_GPSInfo()
-        self.set_Make()
-        self.set_Model()
-        self.set_Software()
-        self.set_DateTime()
-        self.set_XResolution()
-        self.set_YResolution()
-        self.set_Flash()
-        self.set_FocalLength()
-        self.set_LensMake()
-        self.set_LensModel()
-    
-    def set_GPSInfo(self):
-        if "GPSInfo" in self.decoded_exif.keys():
-            self.GPSInfo = self.GPS(self.decoded_exif['GPSInfo'])
-    
-    def set_Make(self):
-        if "Make" in self.decoded_exif.keys():
-            self.Make = self._sanitize_value(self.decoded_exif['Make'])
-    
-    def set_Model(self):
-        if "Model" in self.decoded_exif.keys():
-            self.Model = self._sanitize_value(self.decoded_exif['Model'])
-    
-    def set_Software(self):
-        if "Software" in self.decoded_exif.keys():
-            self.Software = self._sanitize_value(self.decoded_exif['Software'])
-    
-    def set_DateTime(self):
-        if "DateTime" in self.decoded_exif.keys():
-            self.DateTime = self._sanitize_value(self.decoded_exif['DateTime'])
-    
-    def set_XResolution(self):
-        if "XResolution" in self.decoded_exif.keys():
-            x_resolution = self.decoded_exif['XResolution']
-            x_resolution = get_float_from_rational(x_resolution)
-            try:
-                self.XResolution = float(x_resolution)
-            except Exception:
-                self.XResolution = self._sanitize_value(x_resolution)
-    
-    def set_YResolution(self):
-        if "YResolution" in self.decoded_exif.keys():
-            y_resolution = self.decoded_exif['YResolution']
-            y_resolution = get_float_from_rational(y_resolution)
-            try:
-                self.YResolution = float(y_resolution)
-            except Exception:
-                self.YResolution = self._sanitize_value(y_resolution)
-    
-    def set_Flash(self):
-        if "Flash" in self.decoded_exif.keys():
-            value = self.decoded_exif['Flash']
-            if isinstance(value, bool):
-                self.Flash = value
-            else:
-                try:
-                    self.Flash = int(value)
-                except Exception:
-                    self.Flash = self._sanitize_value(value)
-    
-    def set_FocalLength(self):
-        if "FocalLength" in self.decoded_exif.keys():
-            focal_length = self.decoded_exif['FocalLength']
-            focal_length = get_float_from_rational(focal_length)
-            try:
-                self.FocalLength = float(focal_length)
-            except Exception:
-                self.FocalLength = self._sanitize_value(focal_length)
-    
-    def set_LensMake(self):
-        if "LensMake" in self.decoded_exif.keys():
-            self.LensMake = self._sanitize_value(self.decoded_exif['LensMake'])
+        if exif_data:
+            self.set_metadata(exif_data)
+
+    @classmethod
+    def from_image(cls, image_path, img):
+        """Read only the IFDs we use (base, Exif and GPS) from an opened image."""
+        exif = img.getexif()
+        tags = dict(exif)
+        tags.update(exif.get_ifd(ExifTags.IFD.Exif))
+        gps_info = exif.get_ifd(ExifTags.IFD.GPSInfo)
+        # In the base IFD this tag holds the GPS IFD's offset, not its contents
+        tags[ExifTags.IFD.GPSInfo] = gps_info or None
+        return cls(image_path, tags)
     
-    def set_LensModel(self):
-        if "LensModel" in self.decoded_exif.keys():
-            self.LensModel = self._sanitize_value(self.decoded_exif['LensModel'])
+    def set_metadata(self, exif_data):
+        get = exif_data.get
+        for tag, name, convert in self._exif_fields:
+            value = get(tag)
+            if value is not None:
+                setattr(self, name, convert(value))
+        if self.DateTime is not None:
+            self.Timestamp = exif_timestamp(self.DateTime)
 
     @staticmethod
     def _sanitize_value(value):
@@ -238,19 +225,17 @@ class Metadata:
         return str(value)
     
     def get_dict(self):
-        if self.GPSInfo is not None:
-            gps_dict = self.GPSInfo.get_dict()
-        else:
-            gps_dict = {}
-        meta_dict = {
-            "GPSLatitude": None,
-            "GPSLongitude": None,
-            "GPSAltitude": None,
-            "GPSDirection": None,
+        gps = self.GPSInfo
+        return {
+            "GPSLatitude": gps.GPSLatitude if gps is not None else None,
+            "GPSLongitude": gps.GPSLongitude if gps is not None else None,
+            "GPSAltitude": gps.GPSAltitude if gps is not None else None,
+            "GPSDirection": gps.GPSDirection if gps is not None else None,
             "Make": self.Make,
             "Model": self.Model,
             "Software": self.Software,
             "DateTime": self.DateTime,
+            "Timestamp": self.Timestamp,
             "XResolution": self.XResolution,
             "YResolution": self.YResolution,
             "Flash": self.Flash,
@@ -258,8 +243,6 @@ class Metadata:
             "LensMake": self.LensMake,
             "LensModel": self.LensModel
         }
-        meta_dict.update(gps_dict)
-        return {k: self._sanitize_value(v) for k, v in meta_dict.items()}
 
     def __repr__(self):
         fields = {
@@ -281,40 +264,307 @@ class Metadata:
                 out += f"{key}: {value}\n"
         return out
 
+# (tag id, attribute, converter) for every EXIF field Metadata keeps
+Metadata._exif_fields = (
+    (ExifTags.IFD.GPSInfo, "GPSInfo", Metadata.GPS),
+    (ExifTags.Base.Make, "Make", Metadata._sanitize_value),
+    (ExifTags.Base.Model, "Model", Metadata._sanitize_value),
+    (ExifTags.Base.Software, "Software", Metadata._sanitize_value),
+    (ExifTags.Base.DateTime, "DateTime", Metadata._sanitize_value),
+    (ExifTags.Base.XResolution, "XResolution", _to_float),
+    (ExifTags.Base.YResolution, "YResolution", _to_float),
+    (ExifTags.Base.Flash, "Flash", _to_int),
+    (ExifTags.Base.FocalLength, "FocalLength", _to_float),
+    (ExifTags.Base.LensMake, "LensMake", Metadata._sanitize_value),
+    (ExifTags.Base.LensModel, "LensModel", Metadata._sanitize_value),
+)
+
+class MetadataBatch:
+    """Column-oriented metadata for a batch of photos.
+
+    Values are appended straight from `Metadata` slots into per-field lists,
+    avoiding the intermediate dicts of `get_dict`; `to_records` builds the
+    one dict per photo that Chroma's API requires, omitting None values.
+    Extra per-photo fields (filename, place names, ...) become columns too.
+    """
+    def __init__(self):
+        self.columns = {name: [] for name in Metadata.fields}
+        self.length = 0
+
+    def append(self, metadata, **extra):
+        columns = self.columns
+        gps = metadata.GPSInfo
+        for name in ("GPSLatitude", "GPSLongitude", "GPSAltitude", "GPSDirection"):
+            columns[name].append(getattr(gps, name) if gps is not None else None)
+        for name in Metadata.fields[4:]:
+            columns[name].append(getattr(metadata, name))
+        for name, value in extra.items():
+            column = columns.get(name)
+            if column is None:
+                column = columns[name] = [None] * self.length
+            column.append(value)
+        self.length += 1
+        for column in columns.values():
+            if len(column) < self.length:
+                column.append(None)
+
+    def __len__(self):
+        return self.length
+
+    def to_records(self):
+        names = list(self.columns)
+        records = []
+        for row in zip(*(self.columns[name] for name in names)):
+            records.append({name: value for name, value in zip(names, row) if value is not None})
+        return records
+
+def decode_pixels(img, target_size=None):
+    """Decode an opened image to a numpy array.
+
+    With `target_size`, the shorter side is scaled down to `target_size` pixels.
+    JPEGs use draft mode so libjpeg decodes at a reduced DCT scale (1/2, 1/4 or
+    1/8) instead of decoding the full frame and throwing most of it away.
+    """
+    if not target_size:
+        return np.array(img)
+    img.draft("RGB", (target_size, target_size))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    width, height = img.size
+    scale = target_size / min(width, height)
+    if scale < 1:
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        img = img.resize(size, Image.Resampling.BICUBIC, reducing_gap=2.0)
+    return np.array(img)
+
+class ImageRecord(dict):
+    """Image record whose "image_np" is decoded from disk on first access.
+
+    Only `record["image_np"]` triggers the decode; `record.get("image_np")`
+    and `"image_np" in record` see whether it has been loaded yet.
+    """
+    target_size = None
+
+    def __missing__(self, key):
+        if key != "image_np":
+            raise KeyError(key)
+        with Image.open(self["file_path"]) as img:
+            img_np = decode_pixels(img, self.target_size)
+        self["image_np"] = img_np
+        return img_np
+
+def load_image(file_path, load_pixels=True, target_size=None, phash=False, hash_content=False, known_hashes=None):
+    """Parse one image's EXIF and, if `load_pixels`, decode its pixels.
+
+    Opening an image only reads its header, so with `load_pixels=False` no pixel
+    data is decoded until `image_np` is accessed. `target_size` selects the
+    reduced-resolution decode used for embedding input (see `decode_pixels`).
+    With `phash`, the record also gets a "phash" perceptual hash (see
+    `dedup.dhash`) for near-duplicate grouping. With `hash_content`, or a
+    `known_hashes` container, the record gets the file's "content_hash";
+    files whose hash is in `known_hashes` are not decoded up front. Returns
+    None if the file can't be read.
+    """
+    filename = os.path.basename(file_path)
+    try:
+        digest = None
+        if hash_content or known_hashes is not None:
+            digest = content_hash(file_path)
+            load_pixels = load_pixels and (known_hashes is None or digest not in known_hashes)
+        with Image.open(file_path) as img:
+            record = ImageRecord(
+                id=image_id(file_path),
+                filename=filename,
+                file_path=file_path,
+                metadata=Metadata.from_image(file_path, img)
+            )
+            record.target_size = target_size
+            if load_pixels:
+                record["image_np"] = decode_pixels(img, target_size)
+            if phash:
+                # Hash the already-decoded (and usually downscaled) pixels when we have them
+                source = Image.fromarray(record["image_np"]) if load_pixels else img
+                record["phash"] = dhash(source)
+            if digest is not None:
+                record["content_hash"] = digest
+        return record
+    except Exception as e:
+        print(f"Error loading image {filename}: {e}")
+        return None
+
+
+# Set in each `ProcessPoolExecutor` worker by its initializer
+_worker_known_hashes = None
+
+
+def _set_worker_known_hashes(known_hashes):
+    global _worker_known_hashes
+    _worker_known_hashes = known_hashes
+
+
+def _load_image_in_worker(file_path, *options):
+    return load_image(file_path, *options, _worker_known_hashes)
+
+
 class Library:
+    """Images under one or more root directories, loaded lazily through `data`.
+
+    Roots are walked recursively with `os.scandir`, so each file costs one
+    cached stat. `include`/`exclude` are glob patterns matched against the
+    path relative to its root (an excluded directory is not descended into),
+    and symlinked directories are followed at most once each, keyed by
+    (st_dev, st_ino), so symlink loops can't recurse forever. Loader workers hash each file
+    with `hash_content`; files whose hash is in `known_hashes` (e.g. an
+    `EmbeddingCache`) are not decoded up front, only on first access.
+    """
     image_types = [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff", ".ico", ".webp", ".heic", ".heif"]
-    def __init__(self, directory_path):
-        if not os.path.exists(directory_path):
-            raise FileNotFoundError(f"The folder path {directory_path} does not exist.")
+    def __init__(self, directory_path, file_paths=None, workers=None, executor="thread", load_pixels=True,
+                 target_size=None, phash=False, recursive=True, include=None, exclude=None, follow_symlinks=True,
+                 hash_content=False, known_hashes=None):
+        roots = [directory_path] if isinstance(directory_path, (str, os.PathLike)) else list(directory_path)
+        for root in roots:
+            if not os.path.exists(root):
+                raise FileNotFoundError(f"The folder path {root} does not exist.")
+        if executor not in ("thread", "process"):
+            raise ValueError(f"executor must be 'thread' or 'process', got {executor!r}")
         self.directory_path = directory_path
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.file_paths = file_paths
+        self.workers = workers
+        self.executor = executor
+        self.load_pixels = load_pixels
+        self.target_size = target_size
+        self.phash = phash
+        self.hash_content = hash_content
+        self.known_hashes = known_hashes
+        self.recursive = recursive
+        self.include = [include] if isinstance(include, str) else list(include or ())
+        self.exclude = [exclude] if isinstance(exclude, str) else list(exclude or ())
+        self.follow_symlinks = follow_symlinks
         self.data = self.load_images()
-    
-    def load_images(self):
-        id_counter = 1
-        for filename in os.listdir(self.directory_path):
-            file_path = os.path.join(self.directory_path, filename)
-            if os.path.isfile(file_path) and os.path.splitext(filename)[1].lower() in self.image_types:
+
+    def _excluded(self, relative_path):
+        return any(fnmatch.fnmatch(relative_path, pattern) for pattern in self.exclude)
+
+    def _included(self, relative_path):
+        return not self.include or any(fnmatch.fnmatch(relative_path, pattern) for pattern in self.include)
+
+    def wants(self, file_path):
+        """Whether `file_path` is an image this library would list (type, root and globs)."""
+        file_path = os.path.abspath(file_path)
+        if os.path.splitext(file_path)[1].lower() not in self.image_types:
+            return False
+        for root in self.roots:
+            if file_path.startswith(os.path.join(root, "")):
+                relative_path = os.path.relpath(file_path, root).replace(os.sep, "/")
+                if not self.recursive and "/" in relative_path:
+                    return False
+                parts = relative_path.split("/")
+                if any(self._excluded("/".join(parts[:i])) for i in range(1, len(parts) + 1)):
+                    return False
+                return self._included(relative_path)
+        return False
+
+    def _subtree(self, root, directory):
+        """(directory, prefix relative to `root`) to start a scan from, or None if outside or excluded."""
+        if directory == root:
+            return root, ""
+        if not directory.startswith(os.path.join(root, "")) or not self.recursive:
+            return None
+        parts = os.path.relpath(directory, root).replace(os.sep, "/").split("/")
+        if any(self._excluded("/".join(parts[:i])) for i in range(1, len(parts) + 1)):
+            return None
+        return directory, "/".join(parts) + "/"
+
+    def scan(self, under=None):
+        """Yield (absolute path, stat result) for every image under the roots.
+
+        With `under`, only that directory's subtree is walked, e.g. an album a
+        file watcher saw appear; globs still match relative to its root.
+        """
+        visited = set()
+        for root in self.roots:
+            start = (root, "") if under is None else self._subtree(root, os.path.abspath(under))
+            if start is None:
+                continue
+            stack = [start]
+            while stack:
+                directory, prefix = stack.pop()
                 try:
-                    img = Image.open(file_path)
-                    exif_data = img._getexif()
-                    img_np = np.array(img)
-                    yield {
-                        "id": f"id{id_counter}",
-                        "filename": filename,
-                        "file_path": file_path,
-                        "image_np": img_np,
-                        "metadata": Metadata(file_path, exif_data)
-                    }
-                except Exception as e:
-                    print(f"Error loading image {filename}: {e}")
+                    st = os.stat(directory)
+                    if (st.st_dev, st.st_ino) in visited:
+                        continue
+                    visited.add((st.st_dev, st.st_ino))
+                    with os.scandir(directory) as it:
+                        entries = sorted(it, key=lambda entry: entry.name)
+                except OSError as e:
+                    print(f"Error scanning {directory}: {e}")
                     continue
-                id_counter += 1
+                subdirectories = []
+                for entry in entries:
+                    relative_path = prefix + entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=self.follow_symlinks):
+                            if self.recursive and not self._excluded(relative_path):
+                                subdirectories.append((entry.path, relative_path + "/"))
+                            continue
+                        if (os.path.splitext(entry.name)[1].lower() not in self.image_types
+                                or not entry.is_file(follow_symlinks=self.follow_symlinks)
+                                or self._excluded(relative_path) or not self._included(relative_path)):
+                            continue
+                        yield os.path.abspath(entry.path), entry.stat(follow_symlinks=self.follow_symlinks)
+                    except OSError as e:
+                        print(f"Error reading {entry.path}: {e}")
+                # Depth-first in name order
+                stack.extend(reversed(subdirectories))
+
+    def list_images(self):
+        for file_path, _ in self.scan():
+            yield file_path
+
+    def load_images(self):
+        file_paths = self.file_paths if self.file_paths is not None else self.list_images()
+        options = (self.load_pixels, self.target_size, self.phash, self.hash_content)
+        if not self.workers or self.workers <= 1:
+            for file_path in file_paths:
+                data = load_image(file_path, *options, self.known_hashes)
+                if data is not None:
+                    yield data
+            return
+        yield from self._load_images_parallel(file_paths, options)
+
+    def _load_images_parallel(self, file_paths, options):
+        # Keep a bounded window of in-flight files so decoded images don't pile up
+        # faster than the consumer drains them, and yield in submission order.
+        window = self.workers * 2
+        if self.executor == "thread":
+            pool = ThreadPoolExecutor(max_workers=self.workers)
+            task, options = load_image, (*options, self.known_hashes)
+        else:
+            # Ship the known hashes to each worker process once, not with every file
+            known_hashes = None if self.known_hashes is None else frozenset(self.known_hashes)
+            pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_set_worker_known_hashes,
+                                       initargs=(known_hashes,))
+            task = _load_image_in_worker
+        with pool:
+            pending = deque()
+            for file_path in file_paths:
+                pending.append(pool.submit(task, file_path, *options))
+                if len(pending) >= window:
+                    data = pending.popleft().result()
+                    if data is not None:
+                        yield data
+            while pending:
+                data = pending.popleft().result()
+                if data is not None:
+                    yield data
 
     def __repr__(self):
         return f"Library(num_images={len(self.metadata)}"
     
 if __name__ == "__main__":
-    library = Library("/Users/anthony/Documents/CS/Coding/photo_query/test_photos")
+    import sys
+    library = Library(sys.argv[1] if len(sys.argv) > 1 else "test_photos", load_pixels=False)
     for data in library.data:
         metadata = data["metadata"]
         for key, value in metadata.get_dict().items():
@@ -1,16 +1,25 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
-from langchain_huggingface import HuggingFacePipeline
+from functools import lru_cache
 from dotenv import load_dotenv
 
 load_dotenv(dotenv_path=".env")
 
 model_name = "google/gemma-3-270m"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForCausalLM.from_pretrained(model_name)
 
-pipe = pipeline("text-generation", model=model, tokenizer=tokenizer, max_new_tokens=100)
-llm = HuggingFacePipeline(pipeline=pipe)
+@lru_cache(maxsize=None)
+def get_llm(model_name=model_name, max_new_tokens=100):
+    """Load the local Gemma pipeline on first use; transformers is only imported here."""
+    from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+    from langchain_huggingface import HuggingFacePipeline
 
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForCausalLM.from_pretrained(model_name)
 
+    pipe = pipeline("text-generation", model=model, tokenizer=tokenizer, max_new_tokens=max_new_tokens)
+    return HuggingFacePipeline(pipeline=pipe)
 
 
+def __getattr__(name):
+    # Backwards compatibility for `from llm import llm`
+    if name == "llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
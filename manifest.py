@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+
+# Bump whenever the stored metadata schema changes so existing collections
+# are fully re-indexed on the next vectorize_directory run.
+MANIFEST_VERSION = 2
+
+
+def content_hash(file_path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(file_path, stat_result=None):
+    st = stat_result if stat_result is not None else os.stat(file_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+class Manifest:
+    """Persisted record of which files are indexed, keyed by absolute path.
+
+    Each entry holds the collection id plus the size/mtime fingerprint (and
+    optionally a content hash) seen when the file was last embedded.
+    `cold` is True when no valid manifest was found (missing, unreadable or
+    an old format), in which case the entries can't say what the collection
+    already holds.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.entries = {}
+        self.cold = True
+        self._pending = []
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            if os.path.exists(self.journal_path):
+                self._replay_journal()
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Ignoring unreadable manifest {self.path}: {e}")
+            return
+        if data.get("version") != MANIFEST_VERSION:
+            print(f"Manifest {self.path} has an old format, re-indexing all files")
+            return
+        self.entries = data.get("entries", {})
+        self.cold = False
+        self._replay_journal()
+
+    def _replay_journal(self):
+        """Apply batches committed by `flush` after the last full `save`."""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write; everything before it is committed
+                    break
+                if op["op"] == "put":
+                    self.entries[op["path"]] = op["entry"]
+                else:
+                    self.entries.pop(op["path"], None)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, f)
+        os.replace(tmp_path, self.path)
+        self._pending = []
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def flush(self):
+        """Durably append pending updates so an interrupted run can resume."""
+        if not self._pending:
+            return
+        directory = os.path.dirname(self.journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            for op in self._pending:
+                f.write(json.dumps(op) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending = []
+
+    def paths_under(self, directory):
+        root = os.path.join(os.path.abspath(directory), "")
+        return [path for path in self.entries if path.startswith(root)]
+
+    def diff(self, fingerprints, directory, use_hash=False, candidates=None):
+        """Compare current fingerprints against the manifest.
+
+        Returns (changed, removed): paths that are new or modified, and
+        previously indexed paths under `directory` (a path or a list of
+        roots) that no longer exist.
+        Files whose size/mtime moved but whose content hash is unchanged
+        are refreshed in place rather than reported as changed. With
+        `candidates` (e.g. paths from file events), only those paths, or
+        indexed files under those directories, are checked for removal
+        instead of the whole directory.
+        """
+        changed = []
+        for path, fingerprint in fingerprints.items():
+            entry = self.entries.get(path)
+            if entry is None:
+                changed.append(path)
+                continue
+            if entry["size"] == fingerprint["size"] and entry["mtime_ns"] == fingerprint["mtime_ns"]:
+                continue
+            if use_hash and entry.get("sha1") and entry["sha1"] == content_hash(path):
+                entry.update(fingerprint)
+                self._pending.append({"op": "put", "path": path, "entry": entry})
+                continue
+            changed.append(path)
+        if candidates is None:
+            roots = [directory] if isinstance(directory, (str, os.PathLike)) else directory
+            removed = [path for root in roots for path in self.paths_under(root) if path not in fingerprints]
+            return changed, sorted(set(removed))
+        removed = set()
+        for path in candidates:
+            if path in fingerprints:
+                continue
+            if path in self.entries:
+                removed.add(path)
+            else:
+                # A deleted or moved-away directory takes its indexed files with it
+                removed.update(p for p in self.paths_under(path) if p not in fingerprints)
+        return changed, sorted(removed)
+
+    def update(self, file_path, item_id, fingerprint, use_hash=False, **extra):
+        entry = {"id": item_id}
+        entry.update(fingerprint)
+        entry.update(extra)
+        if use_hash and "sha1" not in entry:
+            entry["sha1"] = content_hash(file_path)
+        self.entries[file_path] = entry
+        self._pending.append({"op": "put", "path": file_path, "entry": entry})
+
+    def remove(self, file_path):
+        self._pending.append({"op": "del", "path": file_path})
+        return self.entries.pop(file_path, None)
@@ -0,0 +1,127 @@
+from metrics import inc, timed
+from thumbnail_cache import THUMBNAIL_QUALITY, THUMBNAIL_SIZE
+
+# Gemini bills an image up to 384px on each side as a flat 258 tokens
+IMAGE_TOKENS = 258
+CHARS_PER_TOKEN = 4
+CONTEXT_TOKEN_BUDGET = 4096
+# Raw JPEG bytes uploaded per request, which is what bounds upload latency
+CONTEXT_IMAGE_BYTES = 1024 * 1024
+# Largest first; the first entry is the size ingest pre-renders into the cache
+CONTEXT_THUMBNAIL_SIZES = (THUMBNAIL_SIZE, (192, 192), (128, 128))
+# Fields that identify files or drive dedup/filters but mean nothing to the LLM
+HIDDEN_FIELDS = {"file_path", "filename", "PHash", "GroupId", "Timestamp", "XResolution", "YResolution",
+                 "GPSLatitude", "GPSLongitude"}
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return str(value)
+
+
+def _fields(metadata):
+    fields = {}
+    lat, lon = metadata.get("GPSLatitude"), metadata.get("GPSLongitude")
+    if lat is not None and lon is not None:
+        fields["GPS"] = f"{lat:.4f},{lon:.4f}"
+    for key, value in metadata.items():
+        if key in HIDDEN_FIELDS or value is None or value == "":
+            continue
+        if key == "CountryCode" and metadata.get("Country"):
+            continue
+        fields[key] = _format_value(value)
+    return fields
+
+
+class Context:
+    """What `rag.explain` sends for one question: compact metadata text plus image parts.
+
+    `metadatas` are all the retrieved results, in rank order; `images` holds
+    (filename, JPEG bytes) for the ones that fit the budget. `text` lists one
+    line per result, with fields shared by every result factored into a
+    single header line, and marks results sent without an image.
+    """
+    def __init__(self, metadatas, text, images, tokens):
+        self.metadatas = metadatas
+        self.text = text
+        self.images = images
+        self.tokens = tokens
+
+    def parts(self):
+        """The images as `google.genai` content parts, in the order listed in `text`."""
+        from google.genai import types
+        return [types.Part.from_bytes(data=data, mime_type="image/jpeg") for _, data in self.images]
+
+    def __len__(self):
+        return len(self.metadatas)
+
+    def __repr__(self):
+        return f"Context(results={len(self.metadatas)}, images={len(self.images)}, tokens~{self.tokens})"
+
+
+def _pick_thumbnail(thumbnail_cache, file_path, sizes, target_bytes, max_bytes, quality):
+    """Largest thumbnail no bigger than `target_bytes`, else the smallest that fits `max_bytes`."""
+    smallest = None
+    for size in sizes:
+        data = thumbnail_cache.get_or_create_bytes(file_path, size, quality)
+        if len(data) <= target_bytes:
+            return data
+        smallest = data
+    if smallest is not None and len(smallest) <= max_bytes:
+        return smallest
+    return None
+
+
+@timed("context_build")
+def build_context(metadatas, thumbnail_cache, token_budget=CONTEXT_TOKEN_BUDGET, byte_budget=CONTEXT_IMAGE_BYTES,
+                  sizes=CONTEXT_THUMBNAIL_SIZES, quality=THUMBNAIL_QUALITY, max_images=None):
+    """Assemble a `Context` from ranked results within a token and byte budget.
+
+    Results are taken best-first. Each one costs its metadata line, plus
+    `IMAGE_TOKENS` and the JPEG size if its image is attached. Images are
+    attached while both budgets allow, stepping down through `sizes` so the
+    remaining byte budget is shared by the images still to come. After that,
+    results are listed as text only until the token budget runs out. This
+    keeps LLM latency bounded no matter how large `n_results` grows.
+    """
+    rows = [_fields(md) for md in metadatas]
+    common = {}
+    if len(rows) > 1:
+        common = {k: v for k, v in rows[0].items() if all(row.get(k) == v for row in rows[1:])}
+    header = ""
+    if common:
+        header = "All photos: " + ", ".join(f"{k}={v}" for k, v in common.items()) + "\n"
+    tokens = estimate_tokens(header)
+    remaining_bytes = byte_budget
+    lines, images = [], []
+    image_limit = len(metadatas) if max_images is None else max_images
+    for md, row in zip(metadatas, rows):
+        fields = ", ".join(f"{k}={v}" for k, v in row.items() if k not in common)
+        line = f"{md.get('filename', md.get('file_path', '?'))}: {fields}"
+        line_tokens = estimate_tokens(line) + 4
+        if tokens + line_tokens > token_budget:
+            inc("context_results_dropped", len(metadatas) - len(lines))
+            break
+        data = None
+        if len(images) < image_limit and tokens + line_tokens + IMAGE_TOKENS <= token_budget and remaining_bytes > 0:
+            target = remaining_bytes / max(1, min(image_limit, len(metadatas)) - len(images))
+            try:
+                data = _pick_thumbnail(thumbnail_cache, md["file_path"], sizes, target, remaining_bytes, quality)
+            except Exception as e:
+                print(f"Error loading thumbnail for {md.get('filename')}: {e}")
+        if data is not None:
+            images.append((md.get("filename"), data))
+            remaining_bytes -= len(data)
+            tokens += IMAGE_TOKENS
+            line = f"[image {len(images)}] {line}"
+        else:
+            line = f"[no image] {line}"
+        lines.append(line)
+        tokens += line_tokens
+    inc("context_images", len(images))
+    return Context(metadatas[:len(lines)], header + "\n".join(lines), images, tokens)
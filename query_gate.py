@@ -0,0 +1,75 @@
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from vector_db import PERSIST_DIRECTORY
+
+QUERY_LOCK_PATH = os.path.join(PERSIST_DIRECTORY, "queries.lock")
+# How often a waiting ingest re-checks for queries in other processes
+POLL_SECONDS = 0.05
+
+
+class QueryGate:
+    """Tracks in-flight queries so background ingest can yield to them, across processes.
+
+    Query paths wrap their work in `with query_gate.query():`; ingest (e.g.
+    the `sync.py` daemon) calls `wait_idle` between batches. While any query
+    runs, its process holds a shared `flock` on `lock_path`, so `wait_idle`
+    sees queries in other processes by failing to take the lock exclusively;
+    queries in the same process also wake it directly.
+    """
+    def __init__(self, lock_path=QUERY_LOCK_PATH):
+        self.lock_path = lock_path
+        self._active = 0
+        self._cond = threading.Condition()
+        self._file = None
+
+    def _open(self):
+        directory = os.path.dirname(self.lock_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return open(self.lock_path, "a")
+
+    @contextmanager
+    def query(self):
+        with self._cond:
+            if not self._active:
+                self._file = self._open()
+                # Ingest only holds the lock for an instant while probing, so this never waits on a batch
+                fcntl.flock(self._file, fcntl.LOCK_SH)
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                if not self._active:
+                    fcntl.flock(self._file, fcntl.LOCK_UN)
+                    self._file.close()
+                    self._file = None
+                    self._cond.notify_all()
+
+    def _idle_elsewhere(self):
+        with self._open() as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            fcntl.flock(f, fcntl.LOCK_UN)
+            return True
+
+    def wait_idle(self, timeout=None):
+        """Block until no query is running in any process; returns False if `timeout` ran out first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._active == 0, timeout):
+                return False
+        while not self._idle_elsewhere():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_SECONDS)
+        return True
+
+
+query_gate = QueryGate()
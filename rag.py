@@ -1,72 +1,213 @@
 from langchain_core.prompts import PromptTemplate
-from vector_db import collection
+from vector_db import collection_version, get_collection, get_embedding_function, get_text_journal, text_embedding_cache
 from langsmith import traceable
 from typing_extensions import List, TypedDict
 from langchain_core.documents import Document
+from functools import lru_cache
+import asyncio
 import os
-from google import genai
 from dotenv import load_dotenv
-import base64
-from llm import llm
-from PIL import Image
-from io import BytesIO
+from llm import get_llm
+from thumbnail_cache import get_thumbnail_cache
+import prompt_context
+from filters import QueryFilter, matches_where
+from dedup import collapse_duplicates
+from query_cache import TTLCache
+from text_index import reciprocal_rank_fusion
+from query_gate import query_gate
+from metrics import inc, timed
 
 load_dotenv()
 
-api_key = (
-    os.getenv("GOOGLE_API_KEY")
-    or os.getenv("GEMINI_API_KEY")
-    or os.getenv("GOOGLE_GENAI_API_KEY")
-)
-if not api_key:
-    raise RuntimeError(
-        "Missing API key. Set 'GOOGLE_API_KEY' in your environment or .env file."
+@lru_cache(maxsize=None)
+def get_client():
+    """Create the Gemini client on first use, so importing rag needs no API key."""
+    from google import genai
+
+    api_key = (
+        os.getenv("GOOGLE_API_KEY")
+        or os.getenv("GEMINI_API_KEY")
+        or os.getenv("GOOGLE_GENAI_API_KEY")
     )
+    if not api_key:
+        raise RuntimeError(
+            "Missing API key. Set 'GOOGLE_API_KEY' in your environment or .env file."
+        )
+    return genai.Client(api_key=api_key)
 
-client = genai.Client(api_key=api_key)
 prompt = PromptTemplate.from_template(
     """You are a helpful assistant that answers questions about the user's photo library as best as possible. Include the image file name(s) in your response. 
     Be specific and concise about what you observe.
     Use dates, location, and other metadata when relevant.
     If you can't find the answer, say "I don't see that in your photos"
-    Answer ONLY based on the provided base64 encoded images and metadata: {context}\n\n{question}"""
+    Answer ONLY based on the attached images and this metadata, one line per photo; "[image N]" is the N-th attached image and "[no image]" photos have metadata only:
+{context}\n\n{question}"""
 )
 
-def image_encoding(image_file, max_size=(256, 256), quality=85):
-    if image_file.mode in ("RGBA", "LA"):
-        image = image_file.convert("RGB")
-    else:
-        image = image_file
-    image.thumbnail((max_size), Image.Resampling.LANCZOS)
-    buffer = BytesIO()
-    image.save(buffer, format='JPEG', quality=quality, optimize=True)
-    image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    return image_base64
-    
+DEFAULT_CONCURRENCY = 8
+# Over-fetch so that collapsing near-duplicate groups still leaves n_results hits
+DUPLICATE_FETCH_FACTOR = 3
+RESULT_CACHE_TTL = 300
+
+# (question, filters, n_results, collapse, hybrid, collection version) -> result metadatas
+result_cache = TTLCache(max_size=1024, ttl=RESULT_CACHE_TTL)
+
+def build_context(metadatas, token_budget=prompt_context.CONTEXT_TOKEN_BUDGET,
+                  byte_budget=prompt_context.CONTEXT_IMAGE_BYTES, images=True):
+    """Ranked results -> `prompt_context.Context` within the token and image byte budget.
+
+    With `images=False` the context is metadata only (including any
+    captions), so no thumbnails are loaded or sent.
+    """
+    with query_gate.query():
+        return prompt_context.build_context(metadatas, get_thumbnail_cache(), token_budget, byte_budget,
+                                            max_images=None if images else 0)
+
+
+def get_text_index():
+    """The BM25 index, caught up with whatever ingest has journaled since the last query."""
+    journal = get_text_journal()
+    with timed("text_index_refresh"):
+        journal.refresh()
+    return journal
+
+
+def hybrid_rank(question, ids, metadatas, text_index, k, where=None):
+    """Fuse vector hits with BM25 hits over captions/tags by reciprocal rank."""
+    with timed("search_text_query"):
+        text_ids = [doc_id for doc_id, _ in text_index.search(question, k)]
+    by_id = dict(zip(ids, metadatas))
+    missing = [doc_id for doc_id in text_ids if doc_id not in by_id]
+    if missing:
+        fetched = get_collection().get(ids=missing, include=["metadatas"])
+        for doc_id, md in zip(fetched.get("ids", []) or [], fetched.get("metadatas", []) or []):
+            if where is None or matches_where(md, where):
+                by_id[doc_id] = md
+    text_ids = [doc_id for doc_id in text_ids if doc_id in by_id]
+    return [by_id[doc_id] for doc_id in reciprocal_rank_fusion([ids, text_ids])]
+
+
+def embed_questions(questions):
+    vectors = [text_embedding_cache.get(question) for question in questions]
+    misses = [i for i, vector in enumerate(vectors) if vector is None]
+    if misses:
+        computed = get_embedding_function()([questions[i] for i in misses])
+        for i, vector in zip(misses, computed):
+            vectors[i] = vector
+            text_embedding_cache.put(questions[i], vector)
+    return vectors
+
+
+def query_metadatas(questions, n_results=3, filters=None, collapse=True, hybrid=False):
+    """Embed all questions and query the collection in one call; one metadata list per question.
+
+    `filters` is a `QueryFilter` whose constraints are applied by Chroma
+    before ranking, so only matching photos compete for the `n_results` slots.
+    With `collapse`, near-duplicates sharing a GroupId count as one result.
+    With `hybrid`, the vector ranking is fused with a BM25 ranking over
+    captions, tags and place names (see `hybrid_rank`). Results are cached
+    per question until the collection version changes.
+    """
+    if not questions:
+        return []
+    version = collection_version()
+    keys = [(question, repr(filters), n_results, collapse, hybrid, version) for question in questions]
+    all_metadatas = [result_cache.get(key) for key in keys]
+    misses = [i for i, metadatas in enumerate(all_metadatas) if metadatas is None]
+    inc("search_result_cache_hits", len(questions) - len(misses))
+    inc("search_result_cache_misses", len(misses))
+    if not misses:
+        return all_metadatas
+    where = filters.where() if filters is not None else None
+    fetch = n_results
+    # A radius is pre-filtered on its bounding box; fetch extra to survive the exact check
+    if filters is not None and filters.near is not None:
+        fetch *= 2
+    if collapse:
+        fetch *= DUPLICATE_FETCH_FACTOR
+    # Holding the gate makes a `sync.py` watcher, in this process or another, pause between ingest batches
+    with query_gate.query():
+        with timed("search_embed_questions"):
+            query_embeddings = embed_questions([questions[i] for i in misses])
+        with timed("search_vector_query"):
+            result = get_collection().query(include=["metadatas"], n_results=fetch, where=where,
+                                            query_embeddings=query_embeddings)
+        text_index = get_text_index() if hybrid else None
+    for i, ids, metadatas in zip(misses, result.get("ids", []), result.get("metadatas", [])):
+        if text_index is not None:
+            metadatas = hybrid_rank(questions[i], ids, metadatas, text_index, fetch, where)
+        if filters is not None:
+            metadatas = [md for md in metadatas if filters.matches(md)]
+        if collapse:
+            metadatas = collapse_duplicates(metadatas)
+        all_metadatas[i] = metadatas[:n_results]
+        result_cache.put(keys[i], all_metadatas[i])
+    return all_metadatas
+
 
 @traceable
-def search(question):
-    result = collection.query(include=["embeddings", "metadatas"], query_texts=[question], n_results=3)
-    metadatas = result.get("metadatas", [])
-    context_dict = {}
-    for metadata in metadatas:
-        path = metadata[0]["file_path"]
-        with Image.open(path) as image_file:
-            image_base64 = image_encoding(image_file)
-            context_dict[image_base64] = metadata
-    return context_dict
+@timed("search")
+def search_batch(questions, n_results=3, filters=None, collapse=True, hybrid=False, images=True):
+    return [build_context(metadatas, images=images)
+            for metadatas in query_metadatas(list(questions), n_results, filters, collapse, hybrid)]
+
+
+@traceable
+def search(question, n_results=3, filters=None, collapse=True, hybrid=False, images=True):
+    return search_batch([question], n_results=n_results, filters=filters, collapse=collapse,
+                        hybrid=hybrid, images=images)[0]
 
 
 @traceable
 def explain(context, question):
-    # prompt_text = prompt.format(context=context, question=question)
-    # return llm.invoke(prompt_text)
+    # prompt_text = prompt.format(context=context.text, question=question)
+    # return get_llm().invoke(prompt_text)
+
+    with timed("explain_prompt_format"):
+        contents = [prompt.format(context=context.text, question=question), *context.parts()]
+    with timed("explain_llm_call"):
+        return get_client().models.generate_content(model="gemini-2.5-flash", contents=contents).text
+
+
+async def asearch(question, n_results=3, filters=None, hybrid=False, images=True):
+    return await asyncio.to_thread(search, question, n_results, filters, True, hybrid, images)
+
+
+@traceable
+async def aexplain(context, question):
+    with timed("explain_prompt_format"):
+        contents = [prompt.format(context=context.text, question=question), *context.parts()]
+    with timed("explain_llm_call"):
+        response = await get_client().aio.models.generate_content(model="gemini-2.5-flash", contents=contents)
+    return response.text
+
+
+async def answer_many(questions, n_results=3, concurrency=DEFAULT_CONCURRENCY, filters=None, hybrid=False,
+                      images=True):
+    """Answer many questions, overlapping image loading and LLM calls.
+
+    All questions are embedded and retrieved in one collection query, then up
+    to `concurrency` questions at a time load their thumbnails and wait on
+    Gemini. Answers are returned in the order of `questions`. With
+    `images=False`, answers come from metadata and captions alone.
+    """
+    questions = list(questions)
+    all_metadatas = await asyncio.to_thread(query_metadatas, questions, n_results, filters, True, hybrid)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _answer(question, metadatas):
+        async with semaphore:
+            context = await asyncio.to_thread(build_context, metadatas, images=images)
+            return await aexplain(context, question)
+
+    return await asyncio.gather(
+        *(_answer(question, metadatas) for question, metadatas in zip(questions, all_metadatas))
+    )
 
-    return client.models.generate_content(
-        model="gemini-2.5-flash", contents=prompt.format(context=context, question=question)
-    ).text
 
 if __name__ == "__main__":
     question = "Which pictures were taken in Japan?"
-    context = search(question)
+    # Rough bounding box of the Japanese archipelago
+    japan = QueryFilter(bbox=(24.0, 122.9, 45.6, 146.0))
+    context = search(question, filters=japan)
     print(explain(context, question))
\ No newline at end of file
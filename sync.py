@@ -0,0 +1,233 @@
+"""Watch photo directories and keep the collection in sync.
+
+    python sync.py ~/Pictures/uploads --debounce 2 --batch-size 8
+
+Catches up with a normal incremental sync on start, then applies file
+events as they arrive. Uses watchdog (inotify/FSEvents/...) when it is
+installed and falls back to polling fingerprints otherwise. Ingest pauses
+while queries run in any process that uses `query_gate` (e.g. `rag`).
+"""
+import argparse
+import os
+import threading
+import time
+from library import Library
+from manifest import file_fingerprint
+from metrics import inc
+from query_gate import query_gate
+from vector_db import COLLECTION_NAME, VECTOR_BACKEND, Ingestor
+
+DEBOUNCE_SECONDS = 2.0
+# Flush even while events keep arriving, so a long copy doesn't delay indexing forever
+MAX_DELAY_SECONDS = 30.0
+SYNC_BATCH_SIZE = 8
+POLL_INTERVAL = 10.0
+# Longest an ingest batch waits for in-flight queries before going ahead anyway
+MAX_YIELD_SECONDS = 5.0
+# How often pending index/manifest logs are compacted into snapshots
+CHECKPOINT_SECONDS = 300.0
+
+
+class LibraryWatcher:
+    """Debounced file-event sync of one or more directories into a collection.
+
+    Events only mark paths dirty. Once no event has arrived for `debounce`
+    seconds (or the oldest pending event is `max_delay` old), the dirty
+    paths are synced with one `Ingestor.sync(paths=...)` call per
+    directory, in batches of `batch_size`, so only touched files are
+    decoded and embedded. A move shows up as a delete plus an add; the
+    embedding cache recognises the content, so the model doesn't run
+    again. Before each batch, ingest waits up to `max_yield` seconds for
+    in-flight queries on `gate`. The `Ingestor` stays open for the
+    watcher's lifetime and is checkpointed every `checkpoint_interval`
+    seconds and on exit. Extra keyword arguments go to `Ingestor`.
+    """
+    def __init__(self, directories, collection_name=COLLECTION_NAME, backend=VECTOR_BACKEND,
+                 debounce=DEBOUNCE_SECONDS, max_delay=MAX_DELAY_SECONDS, batch_size=SYNC_BATCH_SIZE,
+                 poll_interval=POLL_INTERVAL, gate=query_gate, max_yield=MAX_YIELD_SECONDS, use_watchdog=True,
+                 checkpoint_interval=CHECKPOINT_SECONDS, **ingest_options):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                raise FileNotFoundError(f"The folder path {directory} does not exist.")
+        self.collection_name = collection_name
+        self.backend = backend
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.gate = gate
+        self.max_yield = max_yield
+        self.use_watchdog = use_watchdog
+        self.checkpoint_interval = checkpoint_interval
+        self.ingestor = Ingestor(collection_name, backend=backend, batch_size=batch_size, **ingest_options)
+        self.library = Library(self.directories, load_pixels=False, include=ingest_options.get("include"),
+                               exclude=ingest_options.get("exclude"))
+        self._pending = {}
+        self._first_event = None
+        self._last_event = None
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._dirty = False
+
+    def _root(self, path):
+        for directory in self.directories:
+            if path == directory or path.startswith(os.path.join(directory, "")):
+                return directory
+        return None
+
+    def notify(self, path):
+        """Mark `path` (a file or directory) as changed; safe to call from any thread."""
+        path = os.path.abspath(path)
+        root = self._root(path)
+        if root is None or path == root:
+            return
+        if os.path.isfile(path) and not self.library.wants(path):
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._pending[path] = root
+            self._last_event = now
+            if self._first_event is None:
+                self._first_event = now
+        inc("sync_events")
+
+    def due(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if not self._pending:
+                return False
+            return now - self._last_event >= self.debounce or now - self._first_event >= self.max_delay
+
+    def _pause(self):
+        if self.gate is not None and not self.gate.wait_idle(self.max_yield):
+            inc("sync_yield_timeouts")
+
+    def sync(self, directory, paths=None):
+        changed, removed = self.ingestor.sync(directory, paths=paths, pause=self._pause)
+        self._dirty = self._dirty or bool(changed or removed)
+
+    def checkpoint(self):
+        if self._dirty:
+            self.ingestor.checkpoint()
+            self._dirty = False
+
+    def flush(self):
+        """Sync every pending path now; returns how many paths were flushed."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._first_event = self._last_event = None
+        by_root = {}
+        for path, root in pending.items():
+            by_root.setdefault(root, []).append(path)
+        for root, paths in by_root.items():
+            self.sync(root, sorted(paths))
+        inc("sync_flushed_paths", len(pending))
+        return len(pending)
+
+    def _scan(self, directory):
+        library = Library(directory, load_pixels=False, include=self.library.include, exclude=self.library.exclude)
+        return {path: file_fingerprint(path, st) for path, st in library.scan()}
+
+    def poll(self):
+        """Polling fallback: diff each directory's fingerprints against the last scan."""
+        for directory in self.directories:
+            current = self._scan(directory)
+            previous = self._snapshots.get(directory, {})
+            for path, fingerprint in current.items():
+                if previous.get(path) != fingerprint:
+                    self.notify(path)
+            for path in previous.keys() - current.keys():
+                self.notify(path)
+            self._snapshots[directory] = current
+
+    def _start_observer(self):
+        if not self.use_watchdog:
+            return None
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            print("watchdog is not installed; polling for changes instead")
+            return None
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type in ("opened", "closed_no_write"):
+                    return
+                watcher.notify(event.src_path)
+                dest_path = getattr(event, "dest_path", "")
+                if dest_path:
+                    watcher.notify(dest_path)
+
+        observer = Observer()
+        for directory in self.directories:
+            observer.schedule(_Handler(), directory, recursive=True)
+        observer.start()
+        return observer
+
+    def run(self, stop=None, tick=0.5):
+        """Catch up, then watch until `stop` (a threading.Event) is set."""
+        stop = stop or threading.Event()
+        for directory in self.directories:
+            self.sync(directory)
+        observer = self._start_observer()
+        if observer is None:
+            for directory in self.directories:
+                self._snapshots[directory] = self._scan(directory)
+        self.checkpoint()
+        next_poll = time.monotonic() + self.poll_interval
+        next_checkpoint = time.monotonic() + self.checkpoint_interval
+        try:
+            while not stop.is_set():
+                stop.wait(tick)
+                if observer is None and time.monotonic() >= next_poll:
+                    self.poll()
+                    next_poll = time.monotonic() + self.poll_interval
+                if self.due():
+                    self.flush()
+                if time.monotonic() >= next_checkpoint:
+                    self.checkpoint()
+                    next_checkpoint = time.monotonic() + self.checkpoint_interval
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            if self._pending:
+                self.flush()
+            self.checkpoint()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch photo directories and keep the collection in sync.")
+    parser.add_argument("directories", nargs="+")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--backend", default=VECTOR_BACKEND)
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS)
+    parser.add_argument("--max-delay", type=float, default=MAX_DELAY_SECONDS)
+    parser.add_argument("--batch-size", type=int, default=SYNC_BATCH_SIZE)
+    parser.add_argument("--poll", action="store_true", help="Poll for changes even if watchdog is installed")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--checkpoint-interval", type=float, default=CHECKPOINT_SECONDS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--dedup-distance", type=int, default=None)
+    parser.add_argument("--captions", action="store_true")
+    parser.add_argument("--include", action="append", help="Only sync paths matching this glob (repeatable)")
+    parser.add_argument("--exclude", action="append", help="Skip paths matching this glob (repeatable)")
+    args = parser.parse_args()
+
+    watcher = LibraryWatcher(args.directories, collection_name=args.collection, backend=args.backend,
+                             debounce=args.debounce, max_delay=args.max_delay, batch_size=args.batch_size,
+                             poll_interval=args.poll_interval, use_watchdog=not args.poll,
+                             checkpoint_interval=args.checkpoint_interval,
+                             workers=args.workers, dedup_distance=args.dedup_distance, captions=args.captions,
+                             include=args.include, exclude=args.exclude)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
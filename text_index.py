@@ -0,0 +1,229 @@
+import fcntl
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from vector_index import PAGE_SIZE, iter_pages
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the there this to was were "
+    "what when where which who with show me my i pictures picture photos photo images image taken".split()
+)
+# Metadata fields whose text is worth matching, besides the caption itself
+TEXT_FIELDS = ("Caption", "Tags", "City", "Region", "Country", "Make", "Model", "LensModel", "DateTime", "filename")
+RRF_K = 60
+# Rewrite the journal once it holds this many more lines than live documents
+JOURNAL_COMPACT_SLACK = 1000
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def metadata_text(metadata, fields=TEXT_FIELDS):
+    return " ".join(str(metadata[field]) for field in fields if metadata.get(field))
+
+
+class BM25Index:
+    """Okapi BM25 over short per-photo documents (captions, tags, place names).
+
+    Postings map each term to {doc_id: term frequency}, so a query only
+    touches the documents containing one of its terms.
+    """
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)
+        self.lengths = {}
+        self.doc_terms = {}
+        self.total_length = 0
+
+    def add(self, doc_id, text):
+        if doc_id in self.lengths:
+            self.remove(doc_id)
+        tokens = tokenize(text)
+        counts = Counter(tokens)
+        for term, count in counts.items():
+            self.postings[term][doc_id] = count
+        self.doc_terms[doc_id] = tuple(counts)
+        self.lengths[doc_id] = len(tokens)
+        self.total_length += len(tokens)
+
+    def remove(self, doc_id):
+        length = self.lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.doc_terms.pop(doc_id):
+            docs = self.postings[term]
+            docs.pop(doc_id, None)
+            if not docs:
+                del self.postings[term]
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def search(self, query, k=10, allowed=None):
+        """Return [(doc_id, score)] for the top `k` documents, optionally limited to `allowed` ids."""
+        if not self.lengths:
+            return []
+        n = len(self.lengths)
+        avg_length = self.total_length / n or 1.0
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)[:k]
+
+
+class TextIndexJournal:
+    """BM25 index kept in step with a collection through an append-only journal.
+
+    Ingest calls `put_many`/`remove_many` as it writes photos, appending one
+    JSON line per document. Readers (possibly other processes) call
+    `search`, which first applies only the lines appended since they last
+    looked, so a collection change costs the changed documents instead of a
+    rescan. `compact` rewrites the journal with one line per live document;
+    a reader notices the new file and reloads it.
+    """
+    def __init__(self, path, fields=TEXT_FIELDS):
+        self.path = path
+        self.fields = fields
+        self.index = BM25Index()
+        self.texts = {}
+        self._lines = 0
+        self._offset = 0
+        self._inode = None
+        self._lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _reset(self, inode=None):
+        self.index = BM25Index()
+        self.texts = {}
+        self._lines = self._offset = 0
+        self._inode = inode
+
+    def _apply(self, op):
+        self._lines += 1
+        if op["op"] == "put":
+            self.texts[op["id"]] = op["text"]
+            self.index.add(op["id"], op["text"])
+        else:
+            self.texts.pop(op["id"], None)
+            self.index.remove(op["id"])
+
+    def refresh(self):
+        """Apply journal lines written since the last refresh; returns the number applied."""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                if self._inode is not None:
+                    self._reset()
+                return 0
+            if st.st_ino != self._inode or st.st_size < self._offset:
+                self._reset(st.st_ino)
+            if st.st_size == self._offset:
+                return 0
+            applied = 0
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                for line in f:
+                    # A line still being written (or torn by a crash) is picked up next time
+                    if not line.endswith(b"\n"):
+                        break
+                    self._offset += len(line)
+                    self._apply(json.loads(line))
+                    applied += 1
+            return applied
+
+    @contextmanager
+    def _file_lock(self):
+        # Writers take the lock before opening the journal, so none can append to a file compaction replaced
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _append(self, ops):
+        if not ops:
+            return
+        data = "".join(json.dumps(op) + "\n" for op in ops).encode("utf-8")
+        with self._file_lock(), open(self.path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def put_many(self, ids, metadatas):
+        """Journal the searchable text of upserted or updated photos."""
+        ops = []
+        for doc_id, md in zip(ids, metadatas):
+            text = metadata_text(md or {}, self.fields)
+            ops.append({"op": "put", "id": doc_id, "text": text} if text else {"op": "del", "id": doc_id})
+        self._append(ops)
+
+    def remove_many(self, ids):
+        self._append([{"op": "del", "id": doc_id} for doc_id in ids])
+
+    def search(self, query, k=10, allowed=None):
+        self.refresh()
+        with self._lock:
+            return self.index.search(query, k, allowed)
+
+    def _rewrite(self, texts):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for doc_id, text in texts.items():
+                f.write(json.dumps({"op": "put", "id": doc_id, "text": text}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def compact(self, slack=JOURNAL_COMPACT_SLACK):
+        """Rewrite the journal if replaced and deleted documents dominate it."""
+        with self._file_lock():
+            self.refresh()
+            with self._lock:
+                if self._lines - len(self.texts) <= slack:
+                    return False
+                self._rewrite(self.texts)
+        return True
+
+    def rebuild(self, collection, page_size=PAGE_SIZE):
+        """Write a fresh journal from every photo in a collection, e.g. one indexed before journaling."""
+        texts = {}
+        for _, page in iter_pages(collection, page_size=page_size):
+            for doc_id, md in zip(page["ids"], page.get("metadatas", []) or []):
+                text = metadata_text(md or {}, self.fields)
+                if text:
+                    texts[doc_id] = text
+        with self._file_lock():
+            self._rewrite(texts)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Merge ranked id lists; each list contributes 1 / (k + rank) per id."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
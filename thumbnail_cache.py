@@ -0,0 +1,156 @@
+import base64
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from io import BytesIO
+from PIL import Image
+from manifest import file_fingerprint
+from metrics import inc, timed
+
+THUMBNAIL_CACHE_DIRECTORY = "./thumbnail_cache"
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+THUMBNAIL_SIZE = (256, 256)
+THUMBNAIL_QUALITY = 85
+# How stale this process's view of the cache size may get before eviction re-reads the disk
+RESCAN_SECONDS = 60.0
+
+@timed("image_encoding")
+def image_encoding(image_file, max_size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    if image_file.mode in ("RGBA", "LA"):
+        image = image_file.convert("RGB")
+    else:
+        image = image_file
+    with timed("image_encoding_thumbnail"):
+        image.thumbnail((max_size), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    with timed("image_encoding_jpeg"):
+        image.save(buffer, format='JPEG', quality=quality, optimize=True)
+    with timed("image_encoding_base64"):
+        image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+    return image_base64
+
+
+class ThumbnailCache:
+    """On-disk cache of base64 JPEG thumbnails with LRU eviction.
+
+    Entries are keyed by the source file's path + size + mtime and the encoding
+    parameters, so an edited photo or a different thumbnail size never hits a
+    stale entry. Recency is tracked through file mtimes, which lets the LRU
+    order survive restarts; the total size is kept under `max_bytes`.
+    Several processes can share the directory: entries another process
+    wrote (e.g. thumbnails pre-rendered by ingest) are adopted on first
+    lookup, and eviction re-reads the directory so it counts their bytes.
+    """
+    def __init__(self, directory=THUMBNAIL_CACHE_DIRECTORY, max_bytes=MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._scanned_at = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """Rebuild the LRU order and total size from the entry files on disk."""
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._scanned_at = time.monotonic()
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".b64"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    # Evicted by another process mid-walk
+                    continue
+                found.append((st.st_mtime_ns, name[:-4], st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def key(self, file_path, max_size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+        fingerprint = file_fingerprint(file_path)
+        raw = f"{os.path.abspath(file_path)}|{fingerprint['size']}|{fingerprint['mtime_ns']}|{max_size[0]}x{max_size[1]}|{quality}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.b64")
+
+    def get(self, file_path, max_size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+        key = self.key(file_path, max_size, quality)
+        entry_path = self._entry_path(key)
+        with self._lock:
+            if key not in self._entries:
+                # Possibly written by another process since we scanned
+                try:
+                    size = os.path.getsize(entry_path)
+                except OSError:
+                    return None
+                self._entries[key] = size
+                self._total_bytes += size
+            self._entries.move_to_end(key)
+        try:
+            with open(entry_path, "r", encoding="ascii") as f:
+                image_base64 = f.read()
+            os.utime(entry_path)
+        except OSError:
+            with self._lock:
+                self._total_bytes -= self._entries.pop(key, 0)
+            return None
+        return image_base64
+
+    def put(self, file_path, image_base64, max_size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+        key = self.key(file_path, max_size, quality)
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        tmp_path = f"{entry_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="ascii") as f:
+            f.write(image_base64)
+        os.replace(tmp_path, entry_path)
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(image_base64)
+            self._total_bytes += len(image_base64)
+            self._evict()
+
+    def get_or_create(self, file_path, max_size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+        with timed("thumbnail_cache_get"):
+            image_base64 = self.get(file_path, max_size, quality)
+        if image_base64 is not None:
+            inc("thumbnail_cache_hits")
+            return image_base64
+        inc("thumbnail_cache_misses")
+        with timed("thumbnail_render"):
+            with timed("image_open"):
+                image_file = Image.open(file_path)
+            with image_file:
+                image_base64 = image_encoding(image_file, max_size=max_size, quality=quality)
+            self.put(file_path, image_base64, max_size, quality)
+        return image_base64
+
+    def get_or_create_bytes(self, file_path, max_size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+        """The thumbnail as raw JPEG bytes, for APIs that take binary image parts."""
+        return base64.b64decode(self.get_or_create(file_path, max_size, quality))
+
+    def _evict(self):
+        if time.monotonic() - self._scanned_at > RESCAN_SECONDS:
+            # Other processes add and evict entries too, so periodically recount what is actually on disk
+            self._scan()
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
+
+
+@lru_cache(maxsize=None)
+def get_thumbnail_cache(directory=THUMBNAIL_CACHE_DIRECTORY, max_bytes=MAX_CACHE_BYTES):
+    return ThumbnailCache(directory, max_bytes)
@@ -1,50 +1,524 @@
-import chromadb
-from chromadb.utils.embedding_functions import OpenCLIPEmbeddingFunction
-from chromadb.utils.data_loaders import ImageLoader
-from langchain_chroma import Chroma
-from library import Library
-import numpy as np
-
-embedding_function = OpenCLIPEmbeddingFunction()
-image_loader = ImageLoader()
-chroma_client = chromadb.PersistentClient(path="./chroma_langchain_db")
-
-def fetch_library(directory):
-    library = Library(directory)
+from collections.abc import Sequence
+from functools import lru_cache
+from library import Library, MetadataBatch, image_id, load_image
+from manifest import Manifest, file_fingerprint
+from thumbnail_cache import get_thumbnail_cache
+from dedup import DuplicateGrouper, camera_key
+from embedding_cache import get_embedding_cache
+from vector_index import PAGE_SIZE, create_index, iter_pages
+from metrics import inc, timed, timed_iter
+from captions import caption_images
+from text_index import TextIndexJournal
+from query_cache import TTLCache
+import fcntl
+import os
+
+PERSIST_DIRECTORY = "./chroma_langchain_db"
+COLLECTION_NAME = "multimodal-collection"
+BATCH_SIZE = 32
+# OpenCLIP ViT models take 224px input; decoding larger than this is wasted work
+EMBED_SIZE = 224
+EMBEDDING_MODEL = "ViT-H-14"
+EMBEDDING_CHECKPOINT = "laion2b_s32b_b79k"
+# "chroma", or a local index: "numpy" (exact baseline) or "hnsw" (see vector_index.py)
+VECTOR_BACKEND = os.getenv("PHOTO_VECTOR_BACKEND", "chroma")
+
+# Heavy objects (OpenCLIP weights, the Chroma client) are built on first use so
+# importing this module is cheap; the getters below are the only constructors.
+
+_embedding_function_override = None
+# Question text -> text embedding from the active embedding function
+text_embedding_cache = TTLCache(max_size=4096)
+
+def set_embedding_function(embedding_function):
+    """Use `embedding_function` instead of OpenCLIP, e.g. a stub for offline benchmarks.
+
+    Call before the first `get_collection`, which binds the function it sees.
+    Pass None to go back to OpenCLIP. Cached question embeddings are dropped,
+    and the embedding cache switches to a namespace for the new function.
+    """
+    global _embedding_function_override
+    _embedding_function_override = embedding_function
+    _get_collection.cache_clear()
+    text_embedding_cache.clear()
+
+def get_embedding_function():
+    if _embedding_function_override is not None:
+        return _embedding_function_override
+    return _get_openclip_embedding_function()
+
+@lru_cache(maxsize=None)
+def _get_openclip_embedding_function():
+    from chromadb.utils.embedding_functions import OpenCLIPEmbeddingFunction
+    return OpenCLIPEmbeddingFunction(model_name=EMBEDDING_MODEL, checkpoint=EMBEDDING_CHECKPOINT)
+
+@lru_cache(maxsize=None)
+def get_image_loader():
+    from chromadb.utils.data_loaders import ImageLoader
+    return ImageLoader()
+
+@lru_cache(maxsize=None)
+def get_chroma_client(persist_directory=PERSIST_DIRECTORY):
+    import chromadb
+    return chromadb.PersistentClient(path=persist_directory)
+
+def get_collection(collection_name=COLLECTION_NAME, backend=VECTOR_BACKEND):
+    # lru_cache keys on how arguments were passed, so normalize them first; two
+    # local index instances over the same files would drift apart
+    return _get_collection(collection_name, backend)
+
+@lru_cache(maxsize=None)
+def _get_collection(collection_name, backend):
+    return create_collection(collection_name, backend)
+
+def get_vector_store(collection_name=COLLECTION_NAME):
+    from langchain_chroma import Chroma
+    return Chroma(collection_name=collection_name, 
+                  embedding_function=get_embedding_function(),
+                  persist_directory=PERSIST_DIRECTORY)
+
+def __getattr__(name):
+    # Backwards compatibility for `from vector_db import collection` and friends
+    getters = {
+        "embedding_function": get_embedding_function,
+        "image_loader": get_image_loader,
+        "chroma_client": get_chroma_client,
+        "collection": get_collection,
+    }
+    if name in getters:
+        return getters[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+class LazyImages(Sequence):
+    """A batch's images, each decoded from its `ImageRecord` on first access."""
+    def __init__(self, records=()):
+        self.records = list(records)
+
+    def append(self, record):
+        self.records.append(record)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        return self.records[i]["image_np"]
+
+    def take(self, positions):
+        return LazyImages(self.records[i] for i in positions)
+
+def fetch_batches(directory, file_paths=None, batch_size=BATCH_SIZE, workers=None, executor="thread",
+                  target_size=EMBED_SIZE, geocoder=None, phash=False, hashes=None, known_hashes=None):
+    """Yield (ids, metadatas, images) in chunks of at most `batch_size`.
+
+    Only one batch of decoded images is alive at a time, so peak memory is
+    bounded by the batch size rather than the size of the library. With a
+    `geocode.ReverseGeocoder`, photos with GPS also get Country/Region/City.
+    With `phash`, each record gets a hex "PHash" perceptual hash. Given a
+    `hashes` dict, the loader workers hash each file and store its content
+    hash there by path. Files whose hash is in `known_hashes` are not
+    decoded by the loader; `images` is then a `LazyImages` that decodes
+    them only if they are indexed.
+    """
+    library = Library(directory, file_paths=file_paths, workers=workers, executor=executor,
+                      target_size=target_size, phash=phash, hash_content=hashes is not None,
+                      known_hashes=known_hashes)
+    new_images = list if known_hashes is None else LazyImages
     ids = []
-    metadatas = []
-    images = []
+    batch = MetadataBatch()
+    images = new_images()
     for data in library.data:
         ids.append(data["id"])
-        md = data["metadata"].get_dict()
-        md["filename"] = data["filename"]
-        md["file_path"] = data["file_path"]
-        md = {k: v for k, v in md.items() if v is not None}
-        metadatas.append(md)
-        images.append(data["image_np"])
-    return ids, metadatas, images
+        metadata = data["metadata"]
+        place = {}
+        if geocoder is not None and metadata.GPSInfo is not None:
+            place = geocoder.lookup(metadata.GPSInfo.GPSLatitude, metadata.GPSInfo.GPSLongitude)
+        if phash:
+            place["PHash"] = f"{data['phash']:016x}"
+        batch.append(metadata, filename=data["filename"], file_path=data["file_path"], **place)
+        if hashes is not None:
+            hashes[data["file_path"]] = data["content_hash"]
+        images.append(data["image_np"] if known_hashes is None else data)
+        if len(ids) >= batch_size:
+            yield ids, batch.to_records(), images
+            ids, batch, images = [], MetadataBatch(), new_images()
+    if ids:
+        yield ids, batch.to_records(), images
 
 
-def create_collection(collection_name):
+def create_collection(collection_name, backend=VECTOR_BACKEND):
+    if backend != "chroma":
+        return create_index(backend, collection_name, PERSIST_DIRECTORY, get_embedding_function())
+    chroma_client = get_chroma_client()
     try:
         collection = chroma_client.get_collection(collection_name, 
-                                                  embedding_function=embedding_function, 
-                                                  data_loader=image_loader)
+                                                  embedding_function=get_embedding_function(), 
+                                                  data_loader=get_image_loader())
     except Exception:
         collection = chroma_client.create_collection(collection_name, 
-                                                 embedding_function=embedding_function, 
-                                                 data_loader=image_loader)
+                                                 embedding_function=get_embedding_function(), 
+                                                 data_loader=get_image_loader())
     return collection
 
-def vectorize_directory(directory):
-    ids, metadatas, images = fetch_library(directory)
-    collection = create_collection("multimodal-collection")
-    collection.add(ids=ids, 
-                  metadatas=metadatas, 
-                  images=images)
-    vector_store = Chroma(collection_name="multimodal-collection", 
-                      embedding_function=embedding_function,
-                      persist_directory="./chroma_langchain_db")
-    return vector_store, collection
-
-vector_store, collection = vectorize_directory("../test_photos")
\ No newline at end of file
+def _state_path(collection_name, backend, extension):
+    # Each backend holds its own copy of the vectors, so each has its own state files
+    suffix = "" if backend == "chroma" else f".{backend}"
+    return os.path.join(PERSIST_DIRECTORY, f"{collection_name}{suffix}.{extension}")
+
+def manifest_path(collection_name, backend=VECTOR_BACKEND):
+    return _state_path(collection_name, backend, "manifest.json")
+
+def get_text_journal(collection_name=COLLECTION_NAME, backend=VECTOR_BACKEND):
+    """BM25 index over a collection's captions, tags and place names, kept up to date by ingest."""
+    return _get_text_journal(collection_name, backend)
+
+@lru_cache(maxsize=None)
+def _get_text_journal(collection_name, backend):
+    journal = TextIndexJournal(_state_path(collection_name, backend, "text.jsonl"))
+    if not journal.exists():
+        # Collections indexed before the journal existed are scanned once
+        collection = get_collection(collection_name, backend)
+        if collection.count():
+            journal.rebuild(collection)
+    return journal
+
+def collection_version(collection_name=COLLECTION_NAME, backend=VECTOR_BACKEND):
+    """Counter bumped on every write to the collection; query caches key on it."""
+    try:
+        with open(_state_path(collection_name, backend, "version"), "r", encoding="ascii") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+def bump_collection_version(collection_name=COLLECTION_NAME, backend=VECTOR_BACKEND):
+    path = _state_path(collection_name, backend, "version")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Writers in other processes bump too; without the lock two of them could write the same version
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        version = collection_version(collection_name, backend) + 1
+        with open(f"{path}.tmp", "w", encoding="ascii") as f:
+            f.write(str(version))
+        os.replace(f"{path}.tmp", path)
+    return version
+
+def stale_ids(collection, fresh_ids, roots, page_size=PAGE_SIZE):
+    """Ids in the collection that a full scan of `roots` doesn't account for.
+
+    Used when the manifest is missing or outdated. Anything not in
+    `fresh_ids` is stale, including the positional `id1..idN` entries of
+    collections built before ids were derived from file paths. The one
+    exception is a path-derived id whose file lies outside `roots`, since
+    that belongs to another directory synced into the same collection.
+    """
+    prefixes = tuple(os.path.join(root, "") for root in roots)
+    stale = []
+    for _, page in iter_pages(collection, page_size=page_size):
+        ids = page["ids"]
+        for item_id, md in zip(ids, page.get("metadatas", []) or [None] * len(ids)):
+            if item_id in fresh_ids:
+                continue
+            file_path = (md or {}).get("file_path")
+            if (item_id.startswith("img_") and file_path
+                    and not os.path.abspath(file_path).startswith(prefixes)):
+                continue
+            stale.append(item_id)
+    return stale
+
+def embedding_cache_name(target_size=EMBED_SIZE):
+    # Vectors depend on the model weights and on the decode resolution fed to them
+    model = f"{EMBEDDING_MODEL}-{EMBEDDING_CHECKPOINT}"
+    if _embedding_function_override is not None:
+        # A stub or other model must never share (and poison) the OpenCLIP namespace
+        function = _embedding_function_override
+        model = getattr(function, "model_name", None) or f"{type(function).__module__}.{type(function).__qualname__}"
+    return f"{model}-{target_size or 'full'}px"
+
+def embed_images(images, hashes=None, cache=None):
+    """Embed images, reusing vectors from an `EmbeddingCache` by content hash."""
+    if not images:
+        return []
+    if cache is None or hashes is None:
+        with timed("embed_model"):
+            return list(get_embedding_function()(images))
+    vectors = cache.get_many(hashes)
+    misses = [i for i, vector in enumerate(vectors) if vector is None]
+    inc("embedding_cache_hits", len(images) - len(misses))
+    inc("embedding_cache_misses", len(misses))
+    if misses:
+        with timed("embed_model"):
+            computed = get_embedding_function()([images[i] for i in misses])
+        for i, vector in zip(misses, computed):
+            vectors[i] = vector
+        cache.put_many([hashes[i] for i in misses], computed)
+    return vectors
+
+def embed_batch(collection, ids, metadatas, images, grouper=None, hashes=None, cache=None):
+    """Embed one ingest batch, computing a single embedding per duplicate group.
+
+    With a `dedup.DuplicateGrouper`, each photo is assigned a "GroupId"; only
+    group representatives are embedded and the other members reuse their
+    representative's vector, fetched from the collection if it was indexed in
+    an earlier batch. Embeddings actually computed go through `embed_images`,
+    so content already in `cache` is never re-embedded.
+    """
+    def _embed(positions):
+        subset = images.take(positions) if isinstance(images, LazyImages) else [images[i] for i in positions]
+        return embed_images(subset,
+                            [hashes[i] for i in positions] if hashes is not None else None, cache)
+
+    if grouper is None:
+        return _embed(range(len(images)))
+    for item_id, md in zip(ids, metadatas):
+        md["GroupId"] = grouper.assign(item_id, int(md["PHash"], 16), md.get("Timestamp"), camera_key(md))
+    representatives = [i for i, md in enumerate(metadatas) if md["GroupId"] == ids[i]]
+    vectors = dict(zip((ids[i] for i in representatives), _embed(representatives)))
+    missing = list({md["GroupId"] for md in metadatas} - vectors.keys())
+    if missing:
+        stored = collection.get(ids=missing, include=["embeddings"])
+        vectors.update(zip(stored.get("ids", []), stored.get("embeddings", [])))
+    orphans = [i for i, md in enumerate(metadatas) if md["GroupId"] not in vectors]
+    if orphans:
+        # The representative is gone from the collection; these photos stand alone
+        for i, vector in zip(orphans, _embed(orphans)):
+            metadatas[i]["GroupId"] = ids[i]
+            vectors[ids[i]] = vector
+    return [vectors[md["GroupId"]] for md in metadatas]
+
+class Ingestor:
+    """Open collection, manifest and duplicate groups for repeated syncs into one collection.
+
+    Loading the manifest, rebuilding the duplicate groups and compacting
+    the collection's state cost O(library), so a long-running caller keeps
+    one `Ingestor` and calls `sync` per change: each batch is made durable
+    by the manifest journal and the index's append-only log, and
+    `checkpoint` folds those into full snapshots every so often.
+
+    - `use_hash`: also compare content hashes, so touched-but-unchanged files
+      aren't re-embedded.
+    - `workers`/`executor`: decode images on a thread or process pool (see
+      `Library`); `target_size` is the decode resolution fed to the model.
+    - `thumbnails`: pre-render the query-time thumbnails as batches commit.
+    - `geocoder`: attach offline place names (see `geocode.ReverseGeocoder`).
+    - `dedup_distance`: group near-duplicates and same-camera bursts (see
+      `dedup.DuplicateGrouper`); a group shares one embedding and a GroupId.
+    - `embedding_cache`: reuse vectors by content hash across rebuilds and
+      moved files (see `EmbeddingCache`).
+    - `backend`: where vectors are stored and searched (see `vector_index`).
+    - `captions`: add a local model's "Caption" and "Tags" to each photo.
+    - `include`/`exclude`: glob filters on the scanned roots (see `Library`).
+    """
+    def __init__(self, collection_name=COLLECTION_NAME, use_hash=False, batch_size=BATCH_SIZE, workers=None,
+                 executor="thread", target_size=EMBED_SIZE, thumbnails=True, geocoder=None, dedup_distance=None,
+                 embedding_cache=True, backend=VECTOR_BACKEND, captions=False, include=None, exclude=None):
+        self.collection_name = collection_name
+        self.backend = backend
+        self.use_hash = use_hash
+        self.batch_size = batch_size
+        self.workers = workers
+        self.executor = executor
+        self.target_size = target_size
+        self.geocoder = geocoder
+        self.captions = captions
+        self.include = include
+        self.exclude = exclude
+        self.collection = get_collection(collection_name, backend)
+        self.thumbnail_cache = get_thumbnail_cache() if thumbnails else None
+        self.cache = get_embedding_cache(embedding_cache_name(target_size)) if embedding_cache else None
+        self.manifest = Manifest(manifest_path(collection_name, backend))
+        self.text_journal = get_text_journal(collection_name, backend)
+        self.grouper = None
+        if dedup_distance is not None:
+            self.grouper = DuplicateGrouper(dedup_distance)
+            entries = self.manifest.entries.values()
+            for entry in entries:
+                if entry.get("group") == entry["id"] and "phash" in entry:
+                    self.grouper.add_representative(entry["id"], int(entry["phash"], 16), entry.get("taken"),
+                                                    entry.get("camera"))
+            for entry in entries:
+                if entry.get("group") not in (None, entry["id"]):
+                    self.grouper.add_member(entry["id"], entry["group"], entry.get("taken"), entry.get("camera"))
+
+    def _scan(self, library, paths):
+        manifest = self.manifest
+        if paths is None:
+            # scandir's stat results double as fingerprints, so each file is stat-ed once
+            fingerprints = {path: file_fingerprint(path, st) for path, st in library.scan()}
+            return fingerprints, manifest.diff(fingerprints, library.roots, use_hash=self.use_hash)
+        fingerprints = {}
+        for path in paths:
+            if os.path.isdir(path):
+                # A directory moved or copied in brings every image under it
+                fingerprints.update((p, file_fingerprint(p, st)) for p, st in library.scan(under=path))
+            elif os.path.isfile(path) and library.wants(path):
+                fingerprints[path] = file_fingerprint(path)
+        return fingerprints, manifest.diff(fingerprints, library.roots, use_hash=self.use_hash, candidates=paths)
+
+    def _delete(self, ids):
+        self.collection.delete(ids=ids)
+        self.text_journal.remove_many(ids)
+        bump_collection_version(self.collection_name, self.backend)
+
+    def sync(self, directory, paths=None, pause=None):
+        """Sync `directory` (or just `paths` under it); returns (changed, removed) counts.
+
+        `paths` are files or directories a file watcher saw change, so only
+        they are rescanned. `pause` is called before each batch and may block
+        to yield to query traffic.
+        """
+        collection, manifest, grouper, cache = self.collection, self.manifest, self.grouper, self.cache
+        use_hash = self.use_hash
+        library = Library(directory, include=self.include, exclude=self.exclude)
+        if paths is not None:
+            paths = [os.path.abspath(path) for path in paths]
+        with timed("ingest_scan"):
+            fingerprints, (changed, removed) = self._scan(library, paths)
+
+        if removed:
+            self._delete([manifest.entries[path]["id"] for path in removed])
+            for path in removed:
+                manifest.remove(path)
+            manifest.flush()
+        if manifest.cold and paths is None:
+            # Without a valid manifest, diff() can't see what's already indexed
+            stale = stale_ids(collection, {image_id(path) for path in fingerprints}, library.roots)
+            if stale:
+                self._delete(stale)
+                print(f"Removed {len(stale)} stale entries not backed by a manifest")
+
+        content_hashes = {} if cache is not None or use_hash else None
+        # Photos already in the embedding cache are only decoded if still needed (captions always need pixels)
+        known_hashes = cache if not self.captions else None
+        batches = fetch_batches(directory, file_paths=changed, batch_size=self.batch_size, workers=self.workers,
+                                executor=self.executor, target_size=self.target_size, geocoder=self.geocoder,
+                                phash=grouper is not None, hashes=content_hashes, known_hashes=known_hashes)
+        # Time spent waiting on the loader is decode + EXIF parsing for the batch
+        for ids, metadatas, images in timed_iter("ingest_load_batch", batches):
+            if pause is not None:
+                pause()
+            hashes = None
+            if content_hashes is not None:
+                hashes = [content_hashes.pop(md["file_path"]) for md in metadatas]
+            with timed("ingest_embed"):
+                embeddings = embed_batch(collection, ids, metadatas, images, grouper, hashes, cache)
+            if self.captions:
+                with timed("ingest_captions"):
+                    add_captions(metadatas, images)
+            with timed("ingest_upsert"):
+                collection.upsert(ids=ids, 
+                                  metadatas=metadatas, 
+                                  embeddings=embeddings)
+                self.text_journal.put_many(ids, metadatas)
+            bump_collection_version(self.collection_name, self.backend)
+            with timed("ingest_manifest"):
+                for i, (item_id, md) in enumerate(zip(ids, metadatas)):
+                    path = md["file_path"]
+                    extra = {}
+                    if grouper is not None:
+                        extra = {"phash": md["PHash"], "group": md["GroupId"], "taken": md.get("Timestamp"),
+                                 "camera": camera_key(md)}
+                    if use_hash:
+                        extra["sha1"] = hashes[i]
+                    manifest.update(path, item_id, fingerprints[path], use_hash=use_hash, **extra)
+                manifest.flush()
+            inc("ingest_images", len(ids))
+            if self.thumbnail_cache is not None:
+                with timed("ingest_thumbnails"):
+                    for md in metadatas:
+                        try:
+                            self.thumbnail_cache.get_or_create(md["file_path"])
+                        except Exception as e:
+                            print(f"Error creating thumbnail for {md['filename']}: {e}")
+
+        if paths is None:
+            # Everything under the roots is now accounted for in the manifest
+            manifest.cold = False
+        print(f"Indexed {len(changed)} new/changed, removed {len(removed)}, "
+              f"unchanged {len(fingerprints) - len(changed)}")
+        return len(changed), len(removed)
+
+    def checkpoint(self):
+        """Compact the index log, manifest journal and BM25 journal into snapshots."""
+        with timed("ingest_checkpoint"):
+            if self.backend != "chroma":
+                self.collection.persist()
+            self.manifest.save()
+            self.text_journal.compact()
+
+def vectorize_directory(directory, collection_name=COLLECTION_NAME, use_hash=False, batch_size=BATCH_SIZE,
+                        workers=None, executor="thread", target_size=EMBED_SIZE, thumbnails=True,
+                        geocoder=None, dedup_distance=None, embedding_cache=True, backend=VECTOR_BACKEND,
+                        captions=False, paths=None, pause=None, include=None, exclude=None):
+    """Incrementally sync `directory` into the collection and checkpoint it.
+
+    Only new or changed files are decoded and embedded, and files that
+    disappeared are deleted; a rerun after a crash resumes after the last
+    committed batch. Options are documented on `Ingestor`, and `paths` and
+    `pause` on `Ingestor.sync`. `directory` may be a list of roots.
+    """
+    ingestor = Ingestor(collection_name, use_hash=use_hash, batch_size=batch_size, workers=workers,
+                        executor=executor, target_size=target_size, thumbnails=thumbnails, geocoder=geocoder,
+                        dedup_distance=dedup_distance, embedding_cache=embedding_cache, backend=backend,
+                        captions=captions, include=include, exclude=exclude)
+    ingestor.sync(directory, paths=paths, pause=pause)
+    ingestor.checkpoint()
+    vector_store = get_vector_store(collection_name) if backend == "chroma" else None
+    return vector_store, ingestor.collection
+
+def add_captions(metadatas, images):
+    for md, (caption, tags) in zip(metadatas, caption_images(images)):
+        if caption:
+            md["Caption"] = caption
+            md["Tags"] = tags
+
+def backfill_captions(collection_name=COLLECTION_NAME, page_size=PAGE_SIZE, batch_size=BATCH_SIZE,
+                      target_size=EMBED_SIZE, backend=VECTOR_BACKEND):
+    """Caption already-indexed photos that have no "Caption" yet, without re-embedding them."""
+    collection = get_collection(collection_name, backend)
+    text_journal = get_text_journal(collection_name, backend)
+    updated = 0
+    for _, page in iter_pages(collection, page_size=page_size):
+        pending = [(item_id, md) for item_id, md in zip(page["ids"], page.get("metadatas", []) or [])
+                   if not md.get("Caption") and md.get("file_path")]
+        for start in range(0, len(pending), batch_size):
+            batch_ids, batch_metadatas, images = [], [], []
+            for item_id, md in pending[start:start + batch_size]:
+                record = load_image(md["file_path"], target_size=target_size)
+                if record is not None:
+                    batch_ids.append(item_id)
+                    batch_metadatas.append(dict(md))
+                    images.append(record["image_np"])
+            if not batch_ids:
+                continue
+            add_captions(batch_metadatas, images)
+            collection.update(ids=batch_ids, metadatas=batch_metadatas)
+            text_journal.put_many(batch_ids, batch_metadatas)
+            bump_collection_version(collection_name, backend)
+            updated += len(batch_ids)
+    print(f"Added captions to {updated} photos")
+    return updated
+
+def backfill_places(geocoder, collection_name=COLLECTION_NAME, page_size=PAGE_SIZE, backend=VECTOR_BACKEND):
+    """Attach place names to already-indexed photos without re-embedding them."""
+    collection = get_collection(collection_name, backend)
+    text_journal = get_text_journal(collection_name, backend)
+    updated = 0
+    for _, page in iter_pages(collection, page_size=page_size):
+        update_ids = []
+        update_metadatas = []
+        for item_id, md in zip(page["ids"], page.get("metadatas", []) or []):
+            place = geocoder.lookup(md.get("GPSLatitude"), md.get("GPSLongitude"))
+            if place and any(md.get(k) != v for k, v in place.items()):
+                update_ids.append(item_id)
+                update_metadatas.append({**md, **place})
+        if update_ids:
+            collection.update(ids=update_ids, metadatas=update_metadatas)
+            text_journal.put_many(update_ids, update_metadatas)
+            bump_collection_version(collection_name, backend)
+            updated += len(update_ids)
+    print(f"Added place names to {updated} photos")
+    return updated
+
+if __name__ == "__main__":
+    import sys
+    vectorize_directory(sys.argv[1] if len(sys.argv) > 1 else "test_photos")
+
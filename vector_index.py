@@ -0,0 +1,510 @@
+import fcntl
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import numpy as np
+from filters import matches_where
+
+BACKENDS = ("chroma", "numpy", "hnsw")
+PAGE_SIZE = 1000
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class VectorIndex(ABC):
+    """The subset of the Chroma collection API the rest of the code relies on.
+
+    `create_collection` returns either a real Chroma collection or one of the
+    local indexes below, so ingest (`vectorize_directory`) and retrieval
+    (`rag.search`) run unchanged on any backend. Results use Chroma's shapes:
+    `get` returns flat lists, `query` one list per query. A backend that
+    misses a method fails at construction, not halfway through an ingest.
+    """
+    @abstractmethod
+    def upsert(self, ids, embeddings, metadatas=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(self, ids, metadatas):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, ids):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, ids=None, include=("metadatas",), limit=None, offset=0, where=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, where=None,
+              include=("metadatas", "distances")):
+        raise NotImplementedError
+
+    @abstractmethod
+    def count(self):
+        raise NotImplementedError
+
+
+class NumpyIndex(VectorIndex):
+    """Exact cosine search over a memory-mapped float32 matrix.
+
+    This is the brute-force baseline: every query is one vectorized
+    matrix-vector product over all live rows, so its results are the ground
+    truth that approximate backends are measured against with `recall_at_k`.
+
+    Vectors are L2-normalized and stored in `<name>.numpy/vectors.f32`, grown
+    by doubling. Ids and metadata live in memory and are persisted as a
+    snapshot plus an append-only log, so every upsert/delete is durable
+    without rewriting the whole index; `persist` compacts the log. State is
+    guarded by one re-entrant lock, so queries from worker threads can run
+    while an ingest thread writes. Other processes may share the index (e.g.
+    a `sync.py` daemon and a query server): every call first applies log
+    lines they appended, reloading after they `persist`, and writers hold an
+    exclusive `flock` on `<name>.numpy/lock` while they pick rows and append.
+    """
+    backend = "numpy"
+
+    def __init__(self, directory, name, embedding_function=None):
+        self.name = name
+        self.embedding_function = embedding_function
+        self.directory = os.path.join(directory, f"{name}.{self.backend}")
+        os.makedirs(self.directory, exist_ok=True)
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.snapshot_path = os.path.join(self.directory, "state.json")
+        self.log_path = os.path.join(self.directory, "state.log")
+        self.lock_path = os.path.join(self.directory, "lock")
+        self._lock = threading.RLock()
+        self._load()
+
+    def _reset(self):
+        self.dim = None
+        self.ids = []
+        self.metadatas = []
+        # Row liveness as a bool array (grown by doubling) so queries mask without a Python loop
+        self.alive = np.zeros(0, dtype=bool)
+        self.rows = {}
+        self.version = 0
+        self._matrix = None
+        self._capacity = 0
+        self._snapshot_stamp = None
+        self._log_inode = None
+        self._log_offset = 0
+
+    def _load(self):
+        self._reset()
+        self._snapshot_stamp = _stamp(self.snapshot_path)
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.dim = state["dim"]
+            self.ids = state["ids"]
+            self.metadatas = state["metadatas"]
+            self.alive = np.array(state["alive"], dtype=bool)
+            self.version = state["version"]
+        self.rows = {self.ids[row]: int(row) for row in np.flatnonzero(self.alive[:len(self.ids)])}
+        self._read_log()
+        self._open_matrix()
+
+    def _read_log(self):
+        """Apply complete log lines past the last one read; returns (put rows, deleted rows)."""
+        put_rows, deleted_rows = [], []
+        try:
+            f = open(self.log_path, "rb")
+        except FileNotFoundError:
+            return put_rows, deleted_rows
+        with f:
+            self._log_inode = os.fstat(f.fileno()).st_ino
+            f.seek(self._log_offset)
+            for line in f:
+                # A line still being written, or torn by a crash, ends without a newline
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    break
+                self._log_offset += len(line)
+                self._apply(op)
+                if op["op"] == "put":
+                    put_rows.append(op["row"])
+                elif op["op"] == "del":
+                    deleted_rows.append(op["row"])
+        return put_rows, deleted_rows
+
+    def _open_matrix(self):
+        if self.dim is not None and os.path.exists(self.vectors_path):
+            self._open(os.path.getsize(self.vectors_path) // (self.dim * 4))
+
+    def _refresh(self):
+        """Catch up with writes made by other processes since this one last looked."""
+        log = _stamp(self.log_path)
+        if _stamp(self.snapshot_path) != self._snapshot_stamp or (self._log_offset and (
+                log is None or log[0] != self._log_inode or log[1] < self._log_offset)):
+            # Another process compacted the log into a new snapshot
+            self._load()
+            self._reloaded()
+            return
+        if log is None or log[1] == self._log_offset:
+            return
+        put_rows, deleted_rows = self._read_log()
+        if len(self.ids) > self._capacity:
+            self._open_matrix()
+        self._caught_up(put_rows, deleted_rows)
+
+    @contextmanager
+    def _writing(self):
+        """Exclusive across threads and processes, caught up with the log, for picking rows and appending."""
+        with self._lock, open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > self._log_offset:
+                    # Drop a torn final line so the next append starts on a line boundary
+                    os.truncate(self.log_path, self._log_offset)
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _apply(self, op):
+        self.version += 1
+        if op["op"] == "dim":
+            self.dim = op["dim"]
+        elif op["op"] == "put":
+            row = op["row"]
+            if row == len(self.ids):
+                if row == len(self.alive):
+                    self.alive = np.concatenate([self.alive, np.zeros(max(row, 1024), dtype=bool)])
+                self.ids.append(op["id"])
+                self.metadatas.append(op["metadata"])
+            else:
+                self.metadatas[row] = op["metadata"]
+            self.alive[row] = True
+            self.rows[op["id"]] = row
+        elif op["op"] == "del":
+            row = op["row"]
+            self.alive[row] = False
+            if self.rows.get(self.ids[row]) == row:
+                del self.rows[self.ids[row]]
+
+    def _log(self, ops):
+        """Append and apply `ops`; callers are inside `_writing`."""
+        if not ops:
+            return
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            for op in ops:
+                f.write(json.dumps(op) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            self._log_inode = os.fstat(f.fileno()).st_ino
+            self._log_offset = os.fstat(f.fileno()).st_size
+        for op in ops:
+            self._apply(op)
+
+    def persist(self):
+        with self._writing():
+            self._persist()
+
+    def _persist(self):
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "ids": self.ids, "metadatas": self.metadatas,
+                       "alive": self.alive[:len(self.ids)].tolist(), "version": self.version}, f)
+        os.replace(tmp_path, self.snapshot_path)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self._snapshot_stamp = _stamp(self.snapshot_path)
+        self._log_inode = None
+        self._log_offset = 0
+
+    def _open(self, capacity):
+        if capacity == 0:
+            return
+        self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._capacity = capacity
+
+    def _reserve(self, rows):
+        if rows <= self._capacity:
+            return
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        # Another process may already have grown the file; never truncate it smaller
+        on_disk = os.path.getsize(self.vectors_path) // (self.dim * 4) if os.path.exists(self.vectors_path) else 0
+        capacity = on_disk
+        if rows > on_disk:
+            capacity = max(rows, on_disk * 2, 1024)
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(capacity * self.dim * 4)
+        self._open(capacity)
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def upsert(self, ids, embeddings, metadatas=None):
+        vectors = self._normalize(embeddings)
+        metadatas = metadatas if metadatas is not None else [{} for _ in ids]
+        with self._writing():
+            ops = []
+            if self.dim is None:
+                ops.append({"op": "dim", "dim": int(vectors.shape[1])})
+                self.dim = int(vectors.shape[1])
+            rows = []
+            new_rows = {}
+            next_row = len(self.ids)
+            for item_id, metadata in zip(ids, metadatas):
+                row = self.rows.get(item_id, new_rows.get(item_id))
+                if row is None:
+                    row = new_rows[item_id] = next_row
+                    next_row += 1
+                rows.append(row)
+                ops.append({"op": "put", "id": item_id, "row": row, "metadata": metadata})
+            self._reserve(next_row)
+            # Vectors are written (and flushed) before the log that makes them visible
+            self._matrix[rows] = vectors
+            self._matrix.flush()
+            self._log(ops)
+            self._vectors_changed(rows, vectors)
+
+    def add(self, ids, embeddings, metadatas=None):
+        self.upsert(ids, embeddings, metadatas)
+
+    def update(self, ids, metadatas):
+        with self._writing():
+            ops = []
+            for item_id, metadata in zip(ids, metadatas):
+                row = self.rows.get(item_id)
+                if row is not None:
+                    ops.append({"op": "put", "id": item_id, "row": row, "metadata": metadata})
+            self._log(ops)
+
+    def delete(self, ids):
+        with self._writing():
+            rows = [self.rows[item_id] for item_id in ids if item_id in self.rows]
+            self._log([{"op": "del", "row": row} for row in rows])
+            self._rows_deleted(rows)
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return len(self.rows)
+
+    def _live_mask(self, where=None):
+        """Bool array over rows: alive and, if `where` is given, matching it."""
+        mask = self.alive[:len(self.ids)].copy()
+        if where is not None:
+            for row in np.flatnonzero(mask):
+                mask[row] = matches_where(self.metadatas[row], where)
+        return mask
+
+    def _live_rows(self, where=None):
+        return np.flatnonzero(self._live_mask(where)).tolist()
+
+    def get(self, ids=None, include=("metadatas",), limit=None, offset=0, where=None):
+        with self._lock:
+            self._refresh()
+            if ids is not None:
+                rows = [self.rows[item_id] for item_id in ids if item_id in self.rows]
+            else:
+                rows = self._live_rows(where)
+            rows = rows[offset:offset + limit if limit is not None else None]
+            return self._result(rows, include)
+
+    def _result(self, rows, include, distances=None):
+        result = {"ids": [self.ids[row] for row in rows]}
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[row] for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = [np.array(self._matrix[row]) for row in rows]
+        if distances is not None and "distances" in include:
+            result["distances"] = distances
+        return result
+
+    def _embed_queries(self, query_embeddings, query_texts):
+        if query_embeddings is None:
+            if self.embedding_function is None:
+                raise ValueError("query_texts needs an embedding_function")
+            query_embeddings = self.embedding_function(list(query_texts))
+        return self._normalize(query_embeddings)
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, where=None,
+              include=("metadatas", "distances")):
+        queries = self._embed_queries(query_embeddings, query_texts)
+        results = {"ids": [], "metadatas": [], "distances": [], "embeddings": []}
+        with self._lock:
+            self._refresh()
+            # One consistent view of the rows for the whole query; the mask and
+            # matrix slice stay valid while upserts grow or remap the index
+            allowed = self._live_mask(where) if self.ids else None
+            matrix = self._matrix[:len(allowed)] if allowed is not None else None
+        for query in queries:
+            rows, sims = self._search(query, n_results, allowed, matrix)
+            with self._lock:
+                single = self._result(rows, include, [float(1.0 - s) for s in sims])
+            for key in results:
+                results[key].append(single.get(key, []))
+        return {key: value for key, value in results.items() if key == "ids" or key in include}
+
+    def _search(self, query, k, allowed, matrix):
+        """Exact top-k rows by cosine similarity among `allowed` rows of `matrix`."""
+        if allowed is None or not allowed.any():
+            return [], []
+        sims = np.asarray(matrix) @ query
+        sims[~allowed] = -np.inf
+        k = min(k, int(allowed.sum()))
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return top.tolist(), sims[top].tolist()
+
+    def _vectors_changed(self, rows, vectors):
+        pass
+
+    def _rows_deleted(self, rows):
+        pass
+
+    def _caught_up(self, put_rows, deleted_rows):
+        pass
+
+    def _reloaded(self):
+        pass
+
+
+class HNSWIndex(NumpyIndex):
+    """Approximate search with an hnswlib graph over the NumpyIndex storage.
+
+    The memory-mapped matrix and metadata log stay the source of truth; the
+    HNSW graph is a derived structure saved by `persist` and rebuilt from the
+    matrix if it is missing or older than the log. Requires `hnswlib`.
+    """
+    backend = "hnsw"
+
+    def __init__(self, directory, name, embedding_function=None, M=16, ef_construction=200, ef_search=64):
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._graph = None
+        super().__init__(directory, name, embedding_function)
+        self.graph_path = os.path.join(self.directory, "graph.bin")
+        self.graph_info_path = os.path.join(self.directory, "graph.json")
+        self._load_graph()
+
+    def _new_graph(self, capacity, path=None):
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("The 'hnsw' backend needs hnswlib: pip install hnswlib") from e
+        graph = hnswlib.Index(space="cosine", dim=self.dim)
+        if path is not None:
+            graph.load_index(path, max_elements=max(capacity, 1024), allow_replace_deleted=True)
+        else:
+            graph.init_index(max_elements=max(capacity, 1024), ef_construction=self.ef_construction,
+                             M=self.M, allow_replace_deleted=True)
+        graph.set_ef(self.ef_search)
+        return graph
+
+    def _load_graph(self):
+        if self.dim is None:
+            return
+        if os.path.exists(self.graph_path) and os.path.exists(self.graph_info_path):
+            with open(self.graph_info_path, "r", encoding="utf-8") as f:
+                info = json.load(f)
+            if info.get("version") == self.version:
+                self._graph = self._new_graph(self._capacity, self.graph_path)
+                return
+        self._graph = self._new_graph(self._capacity)
+        rows = self._live_rows()
+        if rows:
+            self._graph.add_items(np.asarray(self._matrix[rows]), rows)
+
+    def _persist(self):
+        super()._persist()
+        if self._graph is not None:
+            self._graph.save_index(self.graph_path)
+            with open(self.graph_info_path, "w", encoding="utf-8") as f:
+                json.dump({"version": self.version}, f)
+
+    def _caught_up(self, put_rows, deleted_rows):
+        # Rows another process wrote; a metadata-only update just re-adds the same vector
+        if put_rows:
+            self._vectors_changed(put_rows, np.asarray(self._matrix[put_rows]))
+        if deleted_rows:
+            self._rows_deleted(deleted_rows)
+
+    def _reloaded(self):
+        self._graph = None
+        self._load_graph()
+
+    def _vectors_changed(self, rows, vectors):
+        if self._graph is None:
+            self._graph = self._new_graph(self._capacity)
+        if self._capacity > self._graph.get_max_elements():
+            self._graph.resize_index(self._capacity)
+        for row in rows:
+            # Re-adding a deleted label needs it unmarked first
+            try:
+                self._graph.unmark_deleted(row)
+            except RuntimeError:
+                pass
+        self._graph.add_items(vectors, rows)
+
+    def _rows_deleted(self, rows):
+        for row in rows:
+            self._graph.mark_deleted(row)
+
+    def _search(self, query, k, allowed, matrix):
+        if self._graph is None or allowed is None or not allowed.any():
+            return [], []
+        k = min(k, int(allowed.sum()))
+        # Labels added after the snapshot fall outside `allowed` and are filtered out
+        with self._lock:
+            labels, distances = self._graph.knn_query(
+                query, k=k, filter=lambda label: label < len(allowed) and bool(allowed[label]))
+        return labels[0].tolist(), [1.0 - d for d in distances[0].tolist()]
+
+
+def iter_pages(collection, include=("metadatas",), page_size=PAGE_SIZE, offset=0, limit=None):
+    """Yield (offset, page) from `collection.get`, one page at a time, starting at `offset`.
+
+    Only one page is held in memory, and the offset of each page doubles as
+    a cursor for resuming an interrupted walk.
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        page = collection.get(include=list(include), limit=size, offset=offset)
+        ids = page.get("ids", []) or []
+        if not len(ids):
+            return
+        yield offset, page
+        offset += len(ids)
+        if remaining is not None:
+            remaining -= len(ids)
+
+
+def create_index(backend, name, directory, embedding_function=None):
+    if backend == "numpy":
+        return NumpyIndex(directory, name, embedding_function)
+    if backend == "hnsw":
+        return HNSWIndex(directory, name, embedding_function)
+    raise ValueError(f"Unknown local vector backend {backend!r}; expected one of {BACKENDS}")
+
+
+def recall_at_k(index, baseline, query_embeddings, k=10, where=None):
+    """Mean fraction of the exact top-k (from `baseline`) that `index` returns."""
+    approx = index.query(query_embeddings=query_embeddings, n_results=k, where=where, include=())["ids"]
+    exact = baseline.query(query_embeddings=query_embeddings, n_results=k, where=where, include=())["ids"]
+    scores = [len(set(a) & set(e)) / len(e) for a, e in zip(approx, exact) if e]
+    return sum(scores) / len(scores) if scores else 1.0